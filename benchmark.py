@@ -0,0 +1,439 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import struct
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import chunk_probe
+import frame_cache
+import frame_codec
+import link_profile
+import operations
+import serial_utils
+import transfer_journal
+
+WORKLOAD_SIZES = {
+    '8K': 0x2000,
+    '128K': 0x20000,
+    '256K': 0x40000,
+    '384K': 0x60000,
+    '512K': 0x80000,
+}
+PAGE_SIZE = 128
+
+
+def _legacy_xor_arr(data: bytes):
+    tbl = [22, 108, 20, 230, 46, 145, 13, 64, 33, 53, 213, 64, 19, 3, 233, 128]
+    x = b""
+    r = 0
+    for byte in data:
+        x += bytes([byte ^ tbl[r]])
+        r = (r + 1) % len(tbl)
+    return x
+
+
+def _legacy_crc16_xmodem(data: bytes):
+    poly = 0x1021
+    crc = 0x0
+    for byte in data:
+        crc = crc ^ (byte << 8)
+        for i in range(8):
+            crc = crc << 1
+            if crc & 0x10000:
+                crc = (crc ^ poly) & 0xFFFF
+    return crc & 0xFFFF
+
+
+def _legacy_encode_frame(data: bytes):
+    crc = _legacy_crc16_xmodem(data)
+    data2 = data + struct.pack("<H", crc)
+    return struct.pack(">HBB", 0xabcd, len(data), 0) + _legacy_xor_arr(data2) + struct.pack(">H", 0xdcba)
+
+
+def _legacy_decode_frame(frame: bytes):
+    return _legacy_xor_arr(frame[4:4 + frame[2]])
+
+
+def _write_packets(image: bytes):
+    # 与 serial_utils.write_extra_eeprom 相同的包格式
+    for addr in range(0, len(image), PAGE_SIZE):
+        page = image[addr:addr + PAGE_SIZE]
+        yield b"\x38\x05\x1c\x00" + struct.pack("<HBB", addr >> 16, len(page) + 2, 0) + \
+            b"\x6a\x39\x57\x64" + struct.pack("<H", addr & 0xFFFF) + page
+
+
+def _time_frames(packets, encode, decode):
+    frames = 0
+    start = time.perf_counter()
+    encoded = [encode(packet) for packet in packets]
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for frame in encoded:
+        decode(frame)
+        frames += 1
+    decode_time = time.perf_counter() - start
+    return frames, encode_time, decode_time
+
+
+def bench_codec(sizes, legacy: bool = True):
+    results = []
+    for name in sizes:
+        size = WORKLOAD_SIZES[name]
+        image = os.urandom(size)
+        packets = list(_write_packets(image))
+        implementations = [('table', frame_codec.encode_frame, frame_codec.decode_frame)]
+        if legacy:
+            implementations.append(('legacy', _legacy_encode_frame, _legacy_decode_frame))
+        for impl_name, encode, decode in implementations:
+            frames, encode_time, decode_time = _time_frames(packets, encode, decode)
+            results.append({
+                'workload': name,
+                'bytes': size,
+                'codec': impl_name,
+                'frames': frames,
+                'encode_us_per_frame': encode_time / frames * 1e6,
+                'decode_us_per_frame': decode_time / frames * 1e6,
+                'total_seconds': encode_time + decode_time,
+            })
+    return results
+
+
+def print_table(results):
+    for r in results:
+        print(f"{r['workload']:>5} {r['codec']:>7}: {r['frames']:5d} 帧, "
+              f"编码 {r['encode_us_per_frame']:8.2f} us/帧, 解码 {r['decode_us_per_frame']:8.2f} us/帧, "
+              f"合计 {r['total_seconds']:.3f} s")
+
+
+class _HeadlessWidget(dict):
+    pass
+
+
+class _HeadlessWindow(_HeadlessWidget):
+    """代替 Tk 窗口, 按时间顺序执行 after() 注册的回调"""
+
+    def __init__(self):
+        super().__init__()
+        self._pending = []
+
+    def after(self, ms, func):
+        self._pending.append((time.perf_counter() + ms / 1000, func))
+
+    def mainloop(self):
+        while self._pending:
+            self._pending.sort(key=lambda item: item[0])
+            due, func = self._pending.pop(0)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            func()
+
+
+class _MeteredPort:
+    def __init__(self, port, meter):
+        self._port = port
+        self._meter = meter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._port.close()
+
+    def write(self, data):
+        start = time.perf_counter()
+        result = self._port.write(data)
+        self._meter['io_write_seconds'] += time.perf_counter() - start
+        self._meter['wire_bytes_tx'] += len(data)
+        return result
+
+    def read(self, size=1):
+        start = time.perf_counter()
+        data = self._port.read(size)
+        self._meter['io_read_seconds'] += time.perf_counter() - start
+        self._meter['wire_bytes_rx'] += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._port, name)
+
+
+@contextlib.contextmanager
+def _isolated_config(config_dir: str):
+    """把块大小、EEPROM大小、写入帧缓存、适配器配置和写入日志指向 config_dir, 每次测量不受之前运行的影响"""
+    paths = [
+        (chunk_probe, 'CHUNK_SIZE_CACHE_PATH', 'chunk_size_cache.json'),
+        (operations, 'EEPROM_SIZE_CACHE_PATH', 'eeprom_size_cache.json'),
+        (link_profile, 'LINK_PROFILE_PATH', 'link_profiles.json'),
+        (frame_cache, 'CACHE_DIR', 'frame_cache'),
+        (transfer_journal, 'JOURNAL_DIR', 'journal'),
+    ]
+    original = [getattr(module, name) for module, name, _ in paths]
+    for module, name, file_name in paths:
+        setattr(module, name, os.path.join(config_dir, file_name))
+    frames = dict(frame_cache._frames)
+    frame_cache._frames.clear()
+    try:
+        yield
+    finally:
+        for (module, name, _), value in zip(paths, original):
+            setattr(module, name, value)
+        frame_cache._frames.clear()
+        frame_cache._frames.update(frames)
+
+
+@contextlib.contextmanager
+def _instrumented(meter, port_factory, answers, open_path, save_path):
+    """替换串口、收发函数和对话框, 使 functions 中的流程可以在无界面下计时"""
+    import functions
+
+    original = (serial_utils.open_serial_port, serial_utils.send_frame, serial_utils.receive_reply,
+                frame_codec.encode_frame, functions.messagebox, functions.filedialog)
+    send_frame, receive_reply, encode_frame = original[1], original[2], original[3]
+
+    # 写入帧可能在发送前由 frame_cache 预先编码, 编码时间单独统计
+    def timed_encode_frame(data):
+        start = time.perf_counter()
+        try:
+            return encode_frame(data)
+        finally:
+            meter['encode_seconds'] += time.perf_counter() - start
+
+    # send_command 和预编码帧的写入最终都经过 send_frame
+    def timed_send_frame(port, frame):
+        start = time.perf_counter()
+        try:
+            return send_frame(port, frame)
+        finally:
+            meter['send_seconds'] += time.perf_counter() - start
+            meter['frames_tx'] += 1
+
+    def timed_receive_reply(port, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return receive_reply(port, *args, **kwargs)
+        finally:
+            meter['receive_seconds'] += time.perf_counter() - start
+            meter['frames_rx'] += 1
+
+    def show_error(title, message):
+        meter['errors'].append(message)
+
+    answers = list(answers)
+    def open_metered_port(port, *args, **kwargs):
+        metered = _MeteredPort(port_factory(), meter)
+        meter['ports'].append(metered)
+        return metered
+
+    serial_utils.open_serial_port = open_metered_port
+    serial_utils.send_frame = timed_send_frame
+    frame_codec.encode_frame = timed_encode_frame
+    serial_utils.receive_reply = timed_receive_reply
+    functions.messagebox = SimpleNamespace(
+        askquestion=lambda *args, **kwargs: answers.pop(0) if answers else 'yes',
+        showinfo=lambda *args, **kwargs: None,
+        showerror=show_error,
+    )
+    functions.filedialog = SimpleNamespace(
+        askopenfilename=lambda *args, **kwargs: open_path,
+        asksaveasfilename=lambda *args, **kwargs: save_path,
+    )
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield functions
+    finally:
+        (serial_utils.open_serial_port, serial_utils.send_frame, serial_utils.receive_reply,
+         frame_codec.encode_frame, functions.messagebox, functions.filedialog) = original
+
+
+def _workflow_jobs(eeprom_size: int):
+    """返回 (名称, 调用, 对话框回答, 打开文件内容, EEPROM数据量)"""
+    from const_vars import FontType
+
+    image_size = 0x20000 * eeprom_size if eeprom_size > 0 else 0x2000
+    jobs = [
+        ('backup_eeprom', lambda f, a: f.backup_eeprom(*a[:4], eeprom_size), [], None, image_size),
+        ('restore_eeprom', lambda f, a: f.restore_eeprom(*a[:4], eeprom_size), [], os.urandom(image_size),
+         image_size),
+        ('clean_eeprom', lambda f, a: f.clean_eeprom(*a, eeprom_size, 1), ['yes', 'yes', 'no'], None, image_size),
+        ('read_calibration', lambda f, a: f.read_calibration(*a[:4]), [], None, 0x200),
+        ('write_calibration', lambda f, a: f.write_calibration(*a[:4]), [], os.urandom(0x200), 0x200),
+        ('read_config', lambda f, a: f.read_config(*a[:4]), [], None, 0x1D00),
+        ('write_config', lambda f, a: f.write_config(*a[:4]), [], os.urandom(0x1D00), 0x1D00),
+    ]
+    if eeprom_size >= 1:
+        from resources import font, tone
+        jobs += [
+            ('write_font_compressed', lambda f, a: f.write_font(*a, eeprom_size, 1, FontType.GB2312_COMPRESSED),
+             [], None, len(font.GB2312_COMPRESSED)),
+            ('write_font_losehu', lambda f, a: f.write_font(*a, eeprom_size, 1, FontType.LOSEHU_FONT),
+             [], None, len(font.LOSEHU_FONT)),
+            ('write_font_conf', lambda f, a: f.write_font_conf(*a, eeprom_size, 1), [], None, len(font.FONT_CONF)),
+            ('write_tone_options', lambda f, a: f.write_tone_options(*a, eeprom_size, 1), [], None,
+             2 * (len(tone.CTCSS_OPTIONS) + len(tone.DCS_OPTIONS))),
+        ]
+    if eeprom_size >= 2:
+        jobs += [
+            ('write_font_uncompressed',
+             lambda f, a: f.write_font(*a, eeprom_size, 1, FontType.GB2312_UNCOMPRESSED),
+             [], None, len(font.GB2312_UNCOMPRESSED)),
+            ('write_pinyin_old', lambda f, a: f.write_pinyin_index(*a, eeprom_size, 1), [], None,
+             len(font.PINYIN_OLD)),
+            ('write_pinyin_new', lambda f, a: f.write_pinyin_index(*a, eeprom_size, 1, True), [], None,
+             len(font.PINYIN_NEW)),
+        ]
+    return jobs
+
+
+def _run_workflow(job, port_factory, trace_memory: bool):
+    name, call, answers, open_data, data_bytes = job
+    meter = {
+        'frames_tx': 0, 'frames_rx': 0, 'wire_bytes_tx': 0, 'wire_bytes_rx': 0,
+        'send_seconds': 0.0, 'receive_seconds': 0.0, 'io_write_seconds': 0.0, 'io_read_seconds': 0.0,
+        'encode_seconds': 0.0, 'errors': [], 'ports': [],
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        open_path = os.path.join(tmp_dir, 'input.bin')
+        save_path = os.path.join(tmp_dir, 'output.bin')
+        if open_data is not None:
+            with open(open_path, 'wb') as fp:
+                fp.write(open_data)
+        window, progress, status_label = _HeadlessWindow(), _HeadlessWidget(), _HeadlessWidget()
+        with _isolated_config(os.path.join(tmp_dir, 'config')), \
+                _instrumented(meter, port_factory, answers, open_path, save_path) as functions:
+            if trace_memory:
+                tracemalloc.start()
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            call(functions, ('sim', window, progress, status_label))
+            # 设备操作在后台线程中执行, 等待任务完成
+            window.mainloop()
+            seconds = time.perf_counter() - start
+            cpu_seconds = time.process_time() - cpu_start
+            peak_memory = None
+            if trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    # 模拟电台不会出错, 出现重发或重新同步说明流程退回了慢速路径, 测得的时间没有意义
+    stats = [serial_utils.link_stats(port) for port in meter['ports']]
+    retries = sum(stat.retries for stat in stats)
+    resyncs = sum(stat.resyncs for stat in stats)
+    if retries or resyncs:
+        meter['errors'].append(f'通信出错: 重试 {retries} 次, 重新同步 {resyncs} 次')
+    io_seconds = meter['io_write_seconds'] + meter['io_read_seconds']
+    frames = meter['frames_tx'] + meter['frames_rx']
+    return {
+        'job': name,
+        'ok': not meter['errors'],
+        'errors': meter['errors'],
+        'seconds': seconds,
+        'cpu_seconds': cpu_seconds,
+        'data_bytes': data_bytes,
+        'bytes_per_second': data_bytes / seconds if seconds else None,
+        'frames_tx': meter['frames_tx'],
+        'frames_rx': meter['frames_rx'],
+        'frames_per_second': frames / seconds if seconds else None,
+        'retries': retries,
+        'resyncs': resyncs,
+        'wire_bytes_tx': meter['wire_bytes_tx'],
+        'wire_bytes_rx': meter['wire_bytes_rx'],
+        'encode_seconds': meter['encode_seconds'],
+        'decode_seconds': meter['receive_seconds'] - meter['io_read_seconds'],
+        'io_wait_seconds': io_seconds,
+        'other_seconds': seconds - meter['send_seconds'] - meter['receive_seconds'] - meter['encode_seconds'],
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+def bench_workflows(size: str, firmware: str = 'LOSEHU124H', baudrate: int = 38400, latency: float = 0.0,
+                    jobs=None, trace_memory: bool = True):
+    from radio_simulator import SimulatedRadio
+
+    eeprom_size = list(WORKLOAD_SIZES).index(size)
+    radio = SimulatedRadio(WORKLOAD_SIZES[size], firmware, baudrate, latency)
+
+    def port_factory():
+        radio.open()
+        return radio
+
+    results = []
+    for job in _workflow_jobs(eeprom_size):
+        if jobs and job[0] not in jobs:
+            continue
+        result = _run_workflow(job, port_factory, False)
+        if trace_memory:
+            # 单独以不限速的方式测量内存峰值, 避免 tracemalloc 影响计时
+            radio.baudrate, radio.latency = 0, 0.0
+            result['peak_memory_bytes'] = _run_workflow(job, port_factory, True)['peak_memory_bytes']
+            radio.baudrate, radio.latency = baudrate, latency
+        results.append(result)
+    return {
+        'suite': 'workflows',
+        'python': platform.python_version(),
+        'eeprom_size': size,
+        'firmware': firmware,
+        'baudrate': baudrate,
+        'latency': latency,
+        'results': results,
+    }
+
+
+def print_workflow_table(report):
+    print(f"EEPROM {report['eeprom_size']}, 波特率 {report['baudrate']}, 回复延迟 {report['latency']} s")
+    for r in report['results']:
+        memory = r['peak_memory_bytes']
+        memory = f"{memory / 1024:8.0f} KiB" if memory is not None else '       -'
+        print(f"{r['job']:>24}: {r['seconds']:8.2f} s, {r['bytes_per_second']:9.0f} B/s, "
+              f"{r['frames_per_second']:7.1f} 帧/s, 编码 {r['encode_seconds']:6.2f} s, "
+              f"解码 {r['decode_seconds']:6.2f} s, IO {r['io_wait_seconds']:7.2f} s, 内存 {memory}"
+              f"{'' if r['ok'] else ', 失败: ' + '; '.join(r['errors'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='K5 Tools 性能测试')
+    sub = parser.add_subparsers(dest='suite', required=True)
+
+    codec_parser = sub.add_parser('codec', help='帧编解码微基准')
+    codec_parser.add_argument('--sizes', default=','.join(WORKLOAD_SIZES),
+                              help='工作负载大小, 逗号分隔 (默认: %(default)s)')
+    codec_parser.add_argument('--no-legacy', action='store_true', help='不测试旧实现')
+    codec_parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+
+    workflow_parser = sub.add_parser('workflows', help='基于模拟电台的完整流程测试')
+    workflow_parser.add_argument('--size', default='256K', choices=list(WORKLOAD_SIZES), help='EEPROM大小')
+    workflow_parser.add_argument('--firmware', default='LOSEHU124H', help='模拟固件版本')
+    workflow_parser.add_argument('--baud', type=int, default=38400, help='模拟波特率, 0为不限速')
+    workflow_parser.add_argument('--latency', type=float, default=0.0, help='每个回复的延迟 (秒)')
+    workflow_parser.add_argument('--jobs', default='', help='只运行指定流程, 逗号分隔')
+    workflow_parser.add_argument('--no-memory', action='store_true', help='不测量内存峰值')
+    workflow_parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    workflow_parser.add_argument('-o', '--output', help='将JSON结果写入文件')
+
+    args = parser.parse_args()
+    if args.suite == 'codec':
+        results = bench_codec(args.sizes.split(','), not args.no_legacy)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_table(results)
+    elif args.suite == 'workflows':
+        jobs = [job for job in args.jobs.split(',') if job]
+        report = bench_workflows(args.size, args.firmware, args.baud, args.latency, jobs, not args.no_memory)
+        if args.output:
+            with open(args.output, 'w') as fp:
+                json.dump(report, fp, indent=2)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_workflow_table(report)
+
+
+if __name__ == '__main__':
+    main()
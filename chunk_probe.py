@@ -0,0 +1,150 @@
+import contextlib
+import json
+import os
+import threading
+
+import serial_utils
+from const_vars import CONFIG_DIR
+from frame_codec import Buffer
+from logger import log
+
+# 候选的每帧数据长度, 从大到小尝试; 都是 CHUNK_ALIGNMENT 的倍数且不超过一帧的容量
+CHUNK_CANDIDATES = (224, 192, 160)
+CHUNK_ALIGNMENT = 32
+# 探测时等待回复的时间, 不支持的长度通常不会有回复
+PROBE_TIMEOUT = 0.5
+CHUNK_SIZE_CACHE_PATH = os.path.join(CONFIG_DIR, 'chunk_size_cache.json')
+
+_cache_lock = threading.Lock()
+
+
+def aligned_step(start_addr: int, step: int) -> int:
+    """起始地址没有按 CHUNK_ALIGNMENT 对齐时使用默认长度, 保证块的边界始终落在对齐的地址上"""
+    if step != serial_utils.DEFAULT_CHUNK_SIZE and start_addr % CHUNK_ALIGNMENT:
+        return serial_utils.DEFAULT_CHUNK_SIZE
+    return step
+
+
+@contextlib.contextmanager
+def _probing(serial_port):
+    """探测期间不重发并缩短超时, 不支持的长度很快失败"""
+    policy = serial_utils.retry_policy(serial_port)
+    timeout = serial_port.timeout
+    serial_utils.set_retry_policy(serial_port, serial_utils.RetryPolicy(max_retries=0))
+    serial_port.timeout = PROBE_TIMEOUT
+    try:
+        yield
+    finally:
+        serial_port.timeout = timeout
+        serial_utils.set_retry_policy(serial_port, policy)
+
+
+def _read(serial_port, addr: int, length: int, extended: bool) -> bytes:
+    if extended:
+        return serial_utils.read_extra_eeprom(serial_port, addr, length)
+    return serial_utils.read_eeprom(serial_port, addr, length)
+
+
+def _read_default(serial_port, addr: int, length: int, extended: bool) -> bytes:
+    step = serial_utils.DEFAULT_CHUNK_SIZE
+    return b''.join(_read(serial_port, offset, min(step, addr + length - offset), extended)
+                    for offset in range(addr, addr + length, step))
+
+
+def probe_read_size(serial_port, extended: bool) -> int:
+    """用候选长度读取EEPROM开头并与默认长度读取的结果比较, 返回可用的最大长度"""
+    reference = _read_default(serial_port, 0, CHUNK_CANDIDATES[0], False)
+    for size in CHUNK_CANDIDATES:
+        try:
+            with _probing(serial_port):
+                ok = all(_read(serial_port, 0, size, mode) == reference[:size]
+                         for mode in ((False, True) if extended else (False,)))
+        except Exception:
+            serial_utils.flush_input(serial_port)
+            ok = False
+        if ok:
+            log(f'读取块大小: {size} 字节')
+            return size
+    return serial_utils.DEFAULT_CHUNK_SIZE
+
+
+def probe_write_size(serial_port, addr: int, data: Buffer, extended: bool, max_size: int, preferred: int = 0) -> int:
+    """用即将写入 addr 的数据探测写入长度, 返回可用的最大长度, 数据太短无法探测时返回 0; preferred 为最先尝试的长度
+
+    每个候选长度连续写入两块并读回比较, 两块一定跨过EEPROM的页边界, 可以发现固件不拆分跨页写入的情况;
+    探测写入的都是本来就要写入的数据, 失败时后续写入会以较小的长度重新写入这部分
+    """
+    data = memoryview(data)
+    candidates = [size for size in CHUNK_CANDIDATES if size <= max_size]
+    if preferred in candidates:
+        candidates.remove(preferred)
+        candidates.insert(0, preferred)
+    if not candidates:
+        return serial_utils.DEFAULT_CHUNK_SIZE
+    if len(data) < 2 * min(candidates):
+        return 0
+    for size in candidates:
+        if len(data) < 2 * size:
+            continue
+        try:
+            with _probing(serial_port):
+                for offset in (0, size):
+                    page = data[offset:offset + size]
+                    if extended:
+                        serial_utils.write_extra_eeprom(serial_port, addr + offset, page)
+                    else:
+                        serial_utils.write_eeprom(serial_port, addr + offset, page)
+            ok = _read_default(serial_port, addr, 2 * size, extended) == data[:2 * size]
+        except Exception:
+            serial_utils.flush_input(serial_port)
+            ok = False
+        if ok:
+            log(f'写入块大小: {size} 字节')
+            return size
+    return serial_utils.DEFAULT_CHUNK_SIZE
+
+
+def _load_cache() -> dict:
+    try:
+        with open(CHUNK_SIZE_CACHE_PATH, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_chunk_sizes(serial_port, version: str, extended: bool):
+    """按固件版本设置串口的读写块大小; 没有缓存时探测读取长度, 写入长度留到第一次写入时探测
+
+    只探测萝狮虎扩容固件 (extended), 其他固件的回复缓冲区只有 DEFAULT_CHUNK_SIZE 字节, 始终使用默认长度
+    """
+    sizes = serial_utils.chunk_sizes(serial_port)
+    if not extended:
+        sizes.read = sizes.write = sizes.write_extended = serial_utils.DEFAULT_CHUNK_SIZE
+        return
+    cached = _load_cache().get(version, {})
+    sizes.read = cached.get('read') or probe_read_size(serial_port, extended)
+    # 同一固件的电台可能换装了不同的EEPROM, 缓存的写入长度必须在本次写入时读回确认
+    sizes.write = sizes.write_extended = 0
+    sizes.write_hint = cached.get('write', 0)
+    sizes.write_extended_hint = cached.get('write_extended', 0)
+
+
+def save_chunk_sizes(serial_port, version: str):
+    sizes = serial_utils.chunk_sizes(serial_port)
+    record = {'read': sizes.read,
+              'write': sizes.write or sizes.write_hint,
+              'write_extended': sizes.write_extended or sizes.write_extended_hint}
+    record = {key: value for key, value in record.items() if value}
+    with _cache_lock:
+        cache = _load_cache()
+        if cache.get(version) == record:
+            return
+        cache[version] = record
+        try:
+            os.makedirs(os.path.dirname(CHUNK_SIZE_CACHE_PATH), exist_ok=True)
+            tmp_path = CHUNK_SIZE_CACHE_PATH + '.tmp'
+            with open(tmp_path, 'w') as fp:
+                json.dump(cache, fp)
+            os.replace(tmp_path, CHUNK_SIZE_CACHE_PATH)
+        except OSError as e:
+            log(f'保存块大小缓存失败: {e}')
@@ -0,0 +1,336 @@
+import argparse
+import contextlib
+import json
+import re
+import sys
+import threading
+import time
+
+import fleet
+import link_profile
+import operations
+import serial_utils
+from const_vars import EEPROM_SIZE, FIRMWARE_VERSION_LIST, FontType
+from frame_trace import FrameTracer
+from logger import log
+from transfer_journal import TransferJournal
+
+SIZE_CHOICES = ['8K', '128K', '256K', '384K', '512K']
+FONT_CHOICES = {
+    'compressed': FontType.GB2312_COMPRESSED,
+    'uncompressed': FontType.GB2312_UNCOMPRESSED,
+    'losehu': FontType.LOSEHU_FONT,
+}
+RESUME_HELP = '上次相同的写入中断时, 校验断点前的数据后从中断处继续写入'
+
+
+class Reporter:
+    """进度输出, --json 时在标准输出逐行输出JSON事件, 日志输出到标准错误"""
+
+    def __init__(self, stream, as_json: bool, port: str = '', lock: threading.Lock = None):
+        self.stream = stream
+        self.as_json = as_json
+        self.stage = ''
+        # 多台电台同时操作时, 进度行会相互覆盖, 只输出阶段信息
+        self.port = port
+        self.show_progress = not port
+        self.lock = lock or threading.Lock()
+        self._last_percent = -1
+
+    def emit(self, event: str, **fields):
+        if self.as_json:
+            if self.port:
+                fields['port'] = self.port
+            line = json.dumps(dict(event=event, **fields), ensure_ascii=False) + '\n'
+            with self.lock:
+                self.stream.write(line)
+                self.stream.flush()
+
+    def end_line(self):
+        if not self.as_json and 0 <= self._last_percent < 100:
+            sys.stderr.write('\n')
+        self._last_percent = -1
+
+    def start(self, stage: str):
+        self.end_line()
+        self.stage = stage
+        self.emit('stage', stage=stage)
+        if not self.as_json:
+            log(f'[{self.port}] 开始: {stage}' if self.port else f'开始: {stage}')
+
+    def progress(self, percent: float, addr: int):
+        if self.as_json:
+            self.emit('progress', stage=self.stage, percent=round(percent, 2), addr=addr)
+        elif self.show_progress and int(percent) != self._last_percent:
+            self._last_percent = int(percent)
+            sys.stderr.write(f'\r进度: {percent:5.1f}%, addr={hex(addr)}')
+            if percent >= 100:
+                sys.stderr.write('\n')
+            sys.stderr.flush()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+
+def _output_path(path: str, port: str) -> str:
+    return path.replace('{port}', re.sub(r'[^\w.-]', '_', port))
+
+
+def _journal(args, session: operations.RadioSession) -> TransferJournal:
+    return TransferJournal(session.port, args.resume)
+
+
+def _run(args, reporter: Reporter, session: operations.RadioSession) -> dict:
+    if not session.check.status:
+        raise Exception(session.check.message)
+    serial_port = session.serial_port
+    firmware_version = session.firmware_version
+    eeprom_size = session.eeprom_size
+    reporter.emit('device', version=session.version, firmware=FIRMWARE_VERSION_LIST[firmware_version],
+                  eeprom_size=EEPROM_SIZE[eeprom_size])
+    result = {'version': session.version, 'eeprom_size': SIZE_CHOICES[eeprom_size]}
+    command = args.command
+    reset = False
+
+    if command == 'info':
+        return result
+    elif command == 'backup':
+        reporter.start('备份EEPROM')
+        operations.backup_eeprom_to_file(serial_port, eeprom_size, _output_path(args.output, session.port),
+                                         reporter.progress)
+        result['bytes'] = operations.eeprom_image_size(eeprom_size)
+    elif command == 'restore':
+        data = _read_file(args.input)
+        expected = operations.eeprom_image_size(eeprom_size)
+        if len(data) != expected and not args.force:
+            raise Exception(f'选择的文件大小为{len(data)}，但目标eeprom大小为{expected}，使用 --force 继续')
+        reporter.start('恢复EEPROM')
+        operations.restore_eeprom(serial_port, data, reporter.progress, args.skip_unchanged, _journal(args, session),
+                                  args.verify)
+        result['bytes'] = len(data)
+        reset = True
+    elif command == 'clean':
+        if not args.yes:
+            raise Exception('清空EEPROM将会删除EEPROM中的所有数据，确认请添加 --yes')
+        reporter.start('清空EEPROM')
+        operations.clean_eeprom(serial_port, eeprom_size, firmware_version, reporter.progress, not args.full)
+        reset = True
+    elif command == 'read-calibration':
+        reporter.start('读取校准参数')
+        operations.read_calibration_to_file(serial_port, _output_path(args.output, session.port), reporter.progress)
+    elif command == 'write-calibration':
+        data = _read_file(args.input)
+        reporter.start('写入校准参数')
+        operations.write_calibration(serial_port, data, reporter.progress, args.verify)
+        reset = True
+    elif command == 'read-config':
+        reporter.start('读取配置参数')
+        operations.read_config_to_file(serial_port, _output_path(args.output, session.port), reporter.progress)
+    elif command == 'write-config':
+        data = _read_file(args.input)
+        reporter.start('写入配置参数')
+        operations.write_config(serial_port, data, reporter.progress, args.verify)
+        reset = True
+    elif command == 'write-font':
+        font_type = FONT_CHOICES[args.type]
+        operations.require_extended(firmware_version, eeprom_size,
+                                    2 if font_type == FontType.GB2312_UNCOMPRESSED else 1, '字库')
+        reporter.start(f'写入字库 ({font_type.value})')
+        operations.write_font(serial_port, font_type, reporter.progress, args.skip_unchanged, _journal(args, session),
+                              args.verify)
+        reset = True
+    elif command == 'write-font-conf':
+        operations.require_extended(firmware_version, eeprom_size, 1, '字库配置')
+        reporter.start('写入字库配置')
+        operations.write_font_conf(serial_port, reporter.progress, args.verify)
+        reset = True
+    elif command == 'write-tones':
+        operations.require_extended(firmware_version, eeprom_size, 1, '亚音参数')
+        reporter.start('写入亚音参数')
+        operations.write_tone_options(serial_port, reporter.progress, args.verify)
+        reset = True
+    elif command == 'write-pinyin':
+        operations.require_extended(firmware_version, eeprom_size, 2, '拼音检索表')
+        reporter.start('写入拼音检索表')
+        operations.write_pinyin_index(serial_port, args.new, reporter.progress, args.skip_unchanged,
+                                      _journal(args, session), args.verify)
+        reset = True
+    elif command == 'auto-write-font':
+        plan = operations.auto_font_plan(session.version)
+        if plan is None:
+            raise Exception('非LOSEHU扩容固件，无法写入')
+        operations.require_extended(firmware_version, eeprom_size,
+                                    2 if plan.font_type == FontType.GB2312_UNCOMPRESSED else 1, '字库')
+        reporter.start(f'写入字库 ({plan.font_type.value})')
+        operations.write_font(serial_port, plan.font_type, reporter.progress, args.skip_unchanged,
+                              _journal(args, session), args.verify)
+        if plan.write_font_conf:
+            reporter.start('写入字库配置')
+            operations.write_font_conf(serial_port, reporter.progress, args.verify)
+            reporter.start('写入亚音参数')
+            operations.write_tone_options(serial_port, reporter.progress, args.verify)
+        if plan.pinyin_new is not None:
+            operations.require_extended(firmware_version, eeprom_size, 2, '拼音检索表')
+            reporter.start('写入拼音检索表')
+            operations.write_pinyin_index(serial_port, plan.pinyin_new, reporter.progress, args.skip_unchanged,
+                                          _journal(args, session), args.verify)
+        result['font_type'] = plan.font_type.name
+        reset = True
+    elif command == 'profile-link':
+        reporter.start('测量串口通信参数')
+        profile = link_profile.profile_link(serial_port, reporter.progress)
+        result['profile'] = profile.as_dict()
+        adapter = link_profile.adapter_id(session.port)
+        if adapter is None:
+            log('无法识别串口适配器的 VID:PID, 测量结果不保存')
+        else:
+            link_profile.save_profile(adapter, profile)
+            log(f'已保存串口适配器 {adapter} 的配置, 之后使用该适配器时自动应用')
+        result['adapter'] = adapter
+    elif command == 'verify':
+        data = _read_file(args.input)
+        reporter.start('校验EEPROM')
+        check = operations.verify_data(serial_port, args.addr, data, reporter.progress, rewrite=args.rewrite)
+        result.update(pages=check.pages, rewritten=check.rewritten, sha256=check.read_sha256,
+                      expected_sha256=check.expected_sha256)
+        if not check.ok:
+            raise Exception(f'校验失败, 共{len(check.mismatched)}页不一致: '
+                            + ', '.join(hex(args.addr + offset) for offset in check.mismatched[:16]))
+        reset = check.rewritten > 0
+
+    if reset and not args.no_reset:
+        session.reset_radio()
+    result['link'] = session.stats.as_dict()
+    return result
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='k5tools', description='K5/K6 小工具集 命令行版本')
+    parser.add_argument('-p', '--port', required=True,
+                        help='串口, 如 /dev/ttyUSB0、COM3、sim://LOSEHU124H 或 replay://捕获文件; '
+                             '多个串口用逗号分隔并同时操作, all 为所有串口')
+    parser.add_argument('--workers', type=int, help='多串口时同时操作的最大数量, 默认为串口数量')
+    parser.add_argument('-s', '--size', choices=SIZE_CHOICES,
+                        help='EEPROM大小, 不指定时自动检测 (仅萝狮虎扩容固件)')
+    parser.add_argument('--json', action='store_true', help='在标准输出逐行输出JSON格式的进度和结果')
+    parser.add_argument('--no-reset', action='store_true', help='写入完成后不复位电台')
+    parser.add_argument('--verify', action='store_true', help='写入后读回校验, 重新写入不一致的页')
+    parser.add_argument('--retries', type=int, default=serial_utils.RetryPolicy.max_retries,
+                        help='单个数据帧出错时的最大重发次数')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='记录每帧各阶段的耗时, 结束后按指令类型保存延迟统计 (JSON), 多个串口时用 {port} 代表串口名')
+    parser.add_argument('--capture', metavar='FILE',
+                        help='把串口收发的原始数据和帧保存到捕获文件, 可以用 -p replay://FILE 回放, 多个串口时用 {port} 代表串口名')
+    parser.add_argument('--no-link-profile', action='store_true', help='不使用 profile-link 保存的串口适配器配置')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('info', help='读取固件版本和EEPROM大小')
+    sub.add_parser('backup', help='备份EEPROM').add_argument('-o', '--output', required=True,
+                                                            help='输出文件, 多个串口时用 {port} 代表串口名')
+    restore = sub.add_parser('restore', help='恢复EEPROM')
+    restore.add_argument('-i', '--input', required=True)
+    restore.add_argument('--force', action='store_true', help='文件大小与EEPROM大小不一致时仍然写入')
+    restore.add_argument('--skip-unchanged', action='store_true', help='只写入内容不同的页')
+    restore.add_argument('--resume', action='store_true', help=RESUME_HELP)
+    clean = sub.add_parser('clean', help='清空EEPROM')
+    clean.add_argument('--yes', action='store_true', help='确认清空')
+    clean.add_argument('--full', action='store_true', help='不读取直接写入所有页, 默认只写入不是空白的页')
+    sub.add_parser('read-calibration', help='读取校准参数').add_argument('-o', '--output', required=True)
+    sub.add_parser('write-calibration', help='写入校准参数').add_argument('-i', '--input', required=True)
+    sub.add_parser('read-config', help='读取配置参数').add_argument('-o', '--output', required=True)
+    sub.add_parser('write-config', help='写入配置参数').add_argument('-i', '--input', required=True)
+    write_font = sub.add_parser('write-font', help='写入字库')
+    write_font.add_argument('--type', choices=list(FONT_CHOICES), required=True)
+    write_font.add_argument('--skip-unchanged', action='store_true', help='只写入内容不同的页')
+    write_font.add_argument('--resume', action='store_true', help=RESUME_HELP)
+    sub.add_parser('write-font-conf', help='写入字库配置')
+    sub.add_parser('write-tones', help='写入亚音参数')
+    write_pinyin = sub.add_parser('write-pinyin', help='写入拼音检索表')
+    write_pinyin.add_argument('--new', action='store_true', help='写入124及以上版本使用的新拼音表')
+    write_pinyin.add_argument('--skip-unchanged', action='store_true', help='只写入内容不同的页')
+    write_pinyin.add_argument('--resume', action='store_true', help=RESUME_HELP)
+    auto = sub.add_parser('auto-write-font', help='根据固件版本自动写入字库、字库配置、亚音参数和拼音表')
+    auto.add_argument('--skip-unchanged', action='store_true', help='只写入内容不同的页')
+    auto.add_argument('--resume', action='store_true', help=RESUME_HELP)
+    sub.add_parser('profile-link', help='测量不同超时、窗口和块大小下的通信速度和出错比例, 按串口适配器保存最好的配置')
+    verify = sub.add_parser('verify', help='读回EEPROM并与文件比较')
+    verify.add_argument('-i', '--input', required=True)
+    verify.add_argument('--addr', type=lambda text: int(text, 0), default=0, help='文件对应的起始地址, 默认为 0')
+    verify.add_argument('--rewrite', action='store_true', help='重新写入不一致的页')
+    return parser
+
+
+def _run_port(args, reporter: Reporter, port: str) -> dict:
+    eeprom_size = None if args.size is None else SIZE_CHOICES.index(args.size)
+    retry_policy = serial_utils.RetryPolicy(max_retries=args.retries)
+    tracer = FrameTracer() if args.trace else None
+    try:
+        capture_path = _output_path(args.capture, port) if args.capture else None
+        use_link_profile = not args.no_link_profile and args.command != 'profile-link'
+        with operations.RadioSession(port, True, eeprom_size, retry_policy, tracer, capture_path,
+                                     use_link_profile) as session:
+            result = _run(args, reporter, session)
+    finally:
+        if tracer is not None:
+            trace_path = _output_path(args.trace, port)
+            tracer.dump(trace_path)
+            log(f'每帧耗时统计已保存到 {trace_path}')
+    if tracer is not None:
+        result['trace'] = trace_path
+    return result
+
+
+def _run_fleet(args, ports, stream) -> int:
+    lock = threading.Lock()
+
+    def job(port: str) -> dict:
+        return _run_port(args, Reporter(stream, args.json, port, lock), port)
+
+    results = fleet.run_fleet(ports, job, args.workers)
+    summary = Reporter(stream, args.json, lock=lock)
+    summary.emit('fleet', command=args.command, results=[
+        dict(port=r.port, ok=r.ok, seconds=round(r.seconds, 3), error=r.error, **r.result) for r in results
+    ])
+    if not args.json:
+        for r in results:
+            log(f'[{r.port}] {"成功" if r.ok else "失败: " + r.error} ({r.seconds:.1f} s)', '')
+        log(f'共{len(results)}台, 成功{sum(r.ok for r in results)}台')
+    return 0 if all(r.ok for r in results) else 1
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    reporter = Reporter(sys.stdout, args.json)
+    start = time.perf_counter()
+    # 日志统一输出到标准错误, 标准输出只保留机器可读的结果
+    with contextlib.redirect_stdout(sys.stderr):
+        ports = fleet.resolve_ports(args.port)
+        if not ports:
+            parser.error('没有可用的串口')
+        if len(ports) > 1:
+            if '{port}' not in getattr(args, 'output', '{port}'):
+                parser.error('多个串口时输出文件名需要包含 {port}')
+            for option in ('trace', 'capture'):
+                if getattr(args, option) and '{port}' not in getattr(args, option):
+                    parser.error(f'多个串口时 --{option} 文件名需要包含 {{port}}')
+            return _run_fleet(args, ports, reporter.stream)
+        try:
+            result = _run_port(args, reporter, ports[0])
+        except Exception as e:
+            reporter.end_line()
+            reporter.emit('error', command=args.command, message=str(e))
+            log(f'操作失败: {e}')
+            return 1
+    reporter.end_line()
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    reporter.emit('done', command=args.command, **result)
+    if not args.json:
+        log(f'操作完成: {args.command}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
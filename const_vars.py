@@ -1,8 +1,12 @@
+import os
 from enum import Enum
 
 FIRMWARE_VERSION_LIST = ['萝狮虎', '萝狮虎扩容', '其他']
 EEPROM_SIZE = ['8KiB (原厂)', '128KiB (1M)', '256KiB (2M)', '384KiB (3M)', '512KiB (4M)']
 
+# 配置文件、写入日志等保存的目录
+CONFIG_DIR = os.path.join(os.getenv('APPDATA') if os.getenv('APPDATA') is not None else '', 'K5_Tools')
+
 
 class FontType(Enum):
     GB2312_COMPRESSED = '压缩GB2312'
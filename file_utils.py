@@ -0,0 +1,83 @@
+import os
+from typing import Optional
+
+from logger import log
+
+# 每写入这么多字节同步一次到磁盘
+DEFAULT_CHECKPOINT_BYTES = 0x10000
+
+
+class AtomicFileWriter:
+    """把数据按偏移写入预分配大小的临时文件, 全部成功后原子替换为目标文件
+
+    写入过程中每隔 checkpoint_bytes 调用一次 fsync; 出错或取消时保留 `<path>.part`,
+    其中已同步的部分仍然有效, 目标文件保持原样
+    """
+
+    def __init__(self, path: str, size: int, checkpoint_bytes: int = DEFAULT_CHECKPOINT_BYTES):
+        self.path = path
+        self.part_path = path + '.part'
+        self.size = size
+        self.checkpoint_bytes = checkpoint_bytes
+        self._fp = None
+        self._unsynced = 0
+
+    def __enter__(self) -> 'AtomicFileWriter':
+        self._fp = open(self.part_path, 'wb')
+        # 预分配文件大小, 页面按地址直接写入对应位置
+        self._fp.truncate(self.size)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def write_at(self, offset: int, data: bytes):
+        if offset + len(data) > self.size:
+            raise Exception(f'写入位置超出文件大小: {hex(offset)}')
+        if self._fp.tell() != offset:
+            self._fp.seek(offset)
+        self._fp.write(data)
+        self._unsynced += len(data)
+        if self._unsynced >= self.checkpoint_bytes:
+            self.sync()
+
+    def sync(self):
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self._unsynced = 0
+
+    def commit(self):
+        self.sync()
+        self._fp.close()
+        self._fp = None
+        os.replace(self.part_path, self.path)
+        _sync_dir(os.path.dirname(os.path.abspath(self.path)))
+
+    def abort(self):
+        if self._fp is None:
+            return
+        try:
+            self.sync()
+        finally:
+            self._fp.close()
+            self._fp = None
+        log(f'操作未完成, 已读取的数据保存在 {self.part_path}')
+
+
+def _sync_dir(path: str):
+    # 确保重命名本身也已写入磁盘, Windows 不支持打开目录
+    flags = getattr(os, 'O_DIRECTORY', None)
+    if flags is None:
+        return
+    fd: Optional[int] = None
+    try:
+        fd = os.open(path, os.O_RDONLY | flags)
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        if fd is not None:
+            os.close(fd)
@@ -0,0 +1,45 @@
+import dataclasses
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import operations
+from logger import log
+
+
+@dataclasses.dataclass
+class FleetResult:
+    port: str
+    ok: bool
+    seconds: float
+    result: dict
+    error: str
+
+
+def resolve_ports(ports: str) -> List[str]:
+    """解析逗号分隔的串口列表, all 表示所有检测到的串口"""
+    if ports == 'all':
+        return operations.get_all_serial_port()
+    return [port for port in ports.split(',') if port]
+
+
+def _run_one(port: str, job: Callable[[str], dict]) -> FleetResult:
+    start = time.perf_counter()
+    try:
+        result = job(port)
+    except Exception as e:
+        log(f'[{port}] 操作失败: {e}')
+        return FleetResult(port, False, time.perf_counter() - start, {}, str(e))
+    return FleetResult(port, True, time.perf_counter() - start, result, '')
+
+
+def run_fleet(ports: List[str], job: Callable[[str], dict], max_workers: Optional[int] = None) -> List[FleetResult]:
+    """每个串口一个线程并行执行 job, 按输入顺序返回每台电台的结果
+
+    每条串口链路的速度由各自的波特率限制, 线程大部分时间在等待串口, 不受GIL影响
+    """
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers or len(ports), thread_name_prefix='fleet') as executor:
+        futures = [executor.submit(_run_one, port, job) for port in ports]
+        return [future.result() for future in futures]
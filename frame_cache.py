@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+from typing import Dict, Optional
+
+import frame_codec
+import serial_utils
+from const_vars import CONFIG_DIR
+from logger import log
+
+CACHE_DIR = os.path.join(CONFIG_DIR, 'frame_cache')
+
+# 文件末尾保存帧数据的SHA-256, 读取时用于发现损坏的缓存
+_DIGEST_SIZE = hashlib.sha256().digest_size
+
+_frames: Dict[str, 'EncodedFrames'] = {}
+_frames_lock = threading.Lock()
+
+
+class EncodedFrames:
+    """一段数据按页编码好的全部写入帧, 写入时直接按偏移取出整帧发送
+
+    除最后一页外每页的帧长度相同, 第 i 页的帧位于 i * frame_size
+    """
+
+    def __init__(self, start_addr: int, data_len: int, step: int, buffer: bytes):
+        self.start_addr = start_addr
+        self.data_len = data_len
+        self.step = step
+        self.extended = is_extended(start_addr, data_len)
+        self.frame_size = frame_size(step, self.extended)
+        self._view = memoryview(buffer)
+
+    def matches(self, start_addr: int, data_len: int, step: int) -> bool:
+        return self.start_addr == start_addr and self.data_len == data_len and self.step == step
+
+    def frame(self, offset: int) -> memoryview:
+        start = offset // self.step * self.frame_size
+        return self._view[start:start + self.frame_size]
+
+
+def is_extended(start_addr: int, data_len: int) -> bool:
+    return start_addr + data_len >= 0x10000
+
+
+def frame_size(page_len: int, extended: bool) -> int:
+    return frame_codec.FRAME_OVERHEAD + len(serial_utils.write_packet(0, b'', extended)) + page_len
+
+
+def encoded_size(data_len: int, step: int, extended: bool) -> int:
+    full_pages, last_page = divmod(data_len, step)
+    size = full_pages * frame_size(step, extended)
+    if last_page:
+        size += frame_size(last_page, extended)
+    return size
+
+
+def encode_write_frame(addr: int, page: frame_codec.Buffer, extended: bool, serial_port=None) -> bytearray:
+    """编码一个写入帧; 给出 serial_port 时由串口编码, 编码耗时计入串口的 FrameTracer"""
+    packet = serial_utils.write_packet(addr, page, extended)
+    if serial_port is not None:
+        return serial_utils.encode_frame(serial_port, packet)
+    return frame_codec.encode_frame(packet)
+
+
+def build_frames(start_addr: int, data: bytes, step: int = 128) -> bytearray:
+    extended = is_extended(start_addr, len(data))
+    view = memoryview(data)
+    buffer = bytearray()
+    for offset in range(0, len(view), step):
+        buffer += encode_write_frame(start_addr + offset, view[offset:offset + step], extended)
+    return buffer
+
+
+def cache_path(start_addr: int, data_hash: str, step: int, cache_dir: Optional[str] = None) -> str:
+    return os.path.join(cache_dir or CACHE_DIR, f'{data_hash[:32]}_{start_addr:05x}_{step}.bin')
+
+
+def load_frames(start_addr: int, data: bytes, step: int = 128, cache_dir: Optional[str] = None) -> EncodedFrames:
+    """返回数据的写入帧, 依次从内存、磁盘缓存中查找, 都没有时编码并保存到磁盘
+
+    缓存以数据的SHA-256、起始地址和页大小区分, 资源内容变化后自动重新编码
+    """
+    data = bytes(data)
+    data_hash = hashlib.sha256(data).hexdigest()
+    path = cache_path(start_addr, data_hash, step, cache_dir)
+    with _frames_lock:
+        frames = _frames.get(path)
+        if frames is not None:
+            return frames
+        size = encoded_size(len(data), step, is_extended(start_addr, len(data)))
+        buffer = _read_cache(path, size)
+        if buffer is None:
+            buffer = bytes(build_frames(start_addr, data, step))
+            _write_cache(path, buffer)
+        frames = EncodedFrames(start_addr, len(data), step, buffer)
+        _frames[path] = frames
+        return frames
+
+
+def _read_cache(path: str, size: int):
+    try:
+        with open(path, 'rb') as fp:
+            content = fp.read()
+    except OSError:
+        return None
+    buffer, digest = content[:-_DIGEST_SIZE], content[-_DIGEST_SIZE:]
+    if len(buffer) != size or hashlib.sha256(buffer).digest() != digest:
+        log(f'写入帧缓存已损坏, 重新编码: {path}')
+        return None
+    return buffer
+
+
+def _write_cache(path: str, buffer: bytes):
+    tmp_path = path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as fp:
+            fp.write(buffer)
+            fp.write(hashlib.sha256(buffer).digest())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # 缓存只用于加速, 保存失败时本次仍使用内存中的帧
+        log(f'保存写入帧缓存失败: {e}')
@@ -0,0 +1,91 @@
+import struct
+from typing import Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+FRAME_HEADER = 0xABCD
+FRAME_FOOTER = 0xDCBA
+# 帧头(4) + CRC(2) + 帧尾(2)
+FRAME_OVERHEAD = 8
+# 长度字段只有一个字节
+MAX_PAYLOAD_LENGTH = 0xFF
+
+XOR_KEY = bytes([22, 108, 20, 230, 46, 145, 13, 64, 33, 53, 213, 64, 19, 3, 233, 128])
+
+
+def _make_crc16_xmodem_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x10000:
+                crc ^= 0x1021
+        table.append(crc & 0xFFFF)
+    return tuple(table)
+
+
+CRC16_XMODEM_TABLE = _make_crc16_xmodem_table()
+
+# 按长度缓存的重复密钥整数, 负载加CRC最长 MAX_PAYLOAD_LENGTH + 2 字节
+_xor_key_stream = XOR_KEY * ((MAX_PAYLOAD_LENGTH + 2) // len(XOR_KEY) + 1)
+_xor_key_ints = {}
+
+
+def crc16_xmodem(data: Buffer) -> int:
+    crc = 0
+    table = CRC16_XMODEM_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+def _xor_key_int(length: int) -> int:
+    key = _xor_key_ints.get(length)
+    if key is None:
+        stream = _xor_key_stream
+        while len(stream) < length:
+            stream += XOR_KEY * len(stream)
+        key = int.from_bytes(stream[:length], 'little')
+        if length <= MAX_PAYLOAD_LENGTH + 2:
+            _xor_key_ints[length] = key
+    return key
+
+
+def xor_obfuscate(data: Buffer) -> bytes:
+    # 整块按大整数异或, 避免逐字节拼接
+    length = len(data)
+    value = int.from_bytes(data, 'little') ^ _xor_key_int(length)
+    return value.to_bytes(length, 'little')
+
+
+def encode_frame(data: Buffer) -> bytearray:
+    length = len(data)
+    if length > MAX_PAYLOAD_LENGTH:
+        raise Exception(f'数据长度超出帧长度限制！({length} > {MAX_PAYLOAD_LENGTH})')
+    body_end = 4 + length + 2
+    frame = bytearray(length + FRAME_OVERHEAD)
+    struct.pack_into('>HBB', frame, 0, FRAME_HEADER, length, 0)
+    frame[4:4 + length] = data
+    struct.pack_into('<H', frame, 4 + length, crc16_xmodem(data))
+    frame[4:body_end] = xor_obfuscate(memoryview(frame)[4:body_end])
+    struct.pack_into('>H', frame, body_end, FRAME_FOOTER)
+    return frame
+
+
+def decode_frame(frame: Buffer):
+    """解析完整的一帧, 返回 (负载, 帧内CRC, 计算CRC)"""
+    frame = memoryview(frame)
+    if len(frame) < FRAME_OVERHEAD:
+        raise Exception('帧长度不正确！')
+    if frame[0] != 0xAB or frame[1] != 0xCD or frame[3] != 0x00:
+        raise Exception('数据头响应错误！')
+    length = frame[2]
+    if len(frame) != length + FRAME_OVERHEAD:
+        raise Exception('指令长度不正确！')
+    if frame[-2] != 0xDC or frame[-1] != 0xBA:
+        raise Exception('尾部数据响应错误！')
+    body = xor_obfuscate(frame[4:4 + length + 2])
+    payload = body[:length]
+    received_crc = body[length] | (body[length + 1] << 8)
+    return payload, received_crc, crc16_xmodem(payload)
@@ -0,0 +1,103 @@
+import json
+import math
+from collections import deque
+from typing import Dict, List
+
+import frame_codec
+
+COMMAND_NAMES = {
+    0x0514: 'hello',
+    0x051B: 'read',
+    0x052B: 'read-extra',
+    0x051D: 'write',
+    0x0538: 'write-extra',
+    0x05DD: 'reset',
+}
+# 没有回复的指令
+NO_REPLY_COMMANDS = {0x05DD}
+# 各阶段: 编码, 写入串口, 等待回复的第一个字节, 接收并解析回复的其余部分, 从发送完成到回复解析完成
+PHASES = ('encode', 'write', 'first_byte', 'body', 'round_trip')
+PERCENTILES = (50, 95, 99)
+
+
+def command_of(frame: frame_codec.Buffer) -> int:
+    """从编码后的帧中取出指令号, 只解码负载的前两个字节"""
+    cmd = frame_codec.xor_obfuscate(bytes(frame[4:6]))
+    return cmd[0] | (cmd[1] << 8)
+
+
+def command_name(cmd: int) -> str:
+    return COMMAND_NAMES.get(cmd, f'0x{cmd:04x}')
+
+
+class FrameTracer:
+    """记录每一帧各阶段的耗时, 按指令类型汇总为延迟直方图和 p50/p95/p99
+
+    由 serial_utils 在收发时调用; 回复按发送顺序与在途的请求对应, 清空输入缓冲区时丢弃在途的请求
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, Dict[str, List[float]]] = {}
+        # 已编码还没有发送的帧的编码耗时, 按编码的顺序发送
+        self._encoded = deque()
+        self._in_flight = deque()
+
+    def _add(self, name: str, phase: str, seconds: float):
+        self.samples.setdefault(name, {}).setdefault(phase, []).append(seconds)
+
+    def encoded(self, seconds: float):
+        # 编码发生在发送之前, 发送时再归入对应的指令类型; 流水线写入会先编码一批帧再发送
+        self._encoded.append(seconds)
+
+    def sent(self, frame: frame_codec.Buffer, write_seconds: float, sent_at: float):
+        cmd = command_of(frame)
+        name = command_name(cmd)
+        if self._encoded:
+            self._add(name, 'encode', self._encoded.popleft())
+        self._add(name, 'write', write_seconds)
+        if cmd not in NO_REPLY_COMMANDS:
+            self._in_flight.append((name, sent_at))
+
+    def received(self, first_byte_seconds: float, body_seconds: float, received_at: float):
+        if not self._in_flight:
+            return
+        name, sent_at = self._in_flight.popleft()
+        self._add(name, 'first_byte', first_byte_seconds)
+        self._add(name, 'body', body_seconds)
+        self._add(name, 'round_trip', received_at - sent_at)
+
+    def flushed(self):
+        self._in_flight.clear()
+
+    def as_dict(self) -> dict:
+        return {name: {phase: summarize(values) for phase, values in phases.items()}
+                for name, phases in sorted(self.samples.items())}
+
+    def dump(self, path: str):
+        with open(path, 'w') as fp:
+            json.dump(self.as_dict(), fp, indent=2)
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    # 最近秩法
+    index = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+def histogram(values: List[float]) -> Dict[str, int]:
+    """按 2 的幂划分的微秒区间计数, 键为区间上限 (微秒)"""
+    buckets = {}
+    for value in values:
+        upper = 1 << max(math.ceil(math.log2(max(value * 1e6, 1))), 0)
+        buckets[upper] = buckets.get(upper, 0) + 1
+    return {str(upper): buckets[upper] for upper in sorted(buckets)}
+
+
+def summarize(values: List[float]) -> dict:
+    ordered = sorted(values)
+    result = {'count': len(ordered), 'mean_ms': round(sum(ordered) / len(ordered) * 1000, 4)}
+    for percent in PERCENTILES:
+        result[f'p{percent}_ms'] = round(percentile(ordered, percent) * 1000, 4)
+    result['max_ms'] = round(ordered[-1] * 1000, 4)
+    result['histogram_us'] = histogram(ordered)
+    return result
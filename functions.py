@@ -1,34 +1,17 @@
-import dataclasses
-import random
-import struct
+import contextlib
 from tkinter import filedialog
-from typing import Union, List
-
-from serial import Serial
+from typing import Any, Callable, Iterator, Optional
 
 from const_vars import FIRMWARE_VERSION_LIST, EEPROM_SIZE, FontType
-import serial_utils
-import serial.tools.list_ports
+import operations
+from operations import SerialPortCheckResult, get_all_serial_port
+from job_runner import JobCancelled, JobRunner
+from transfer_journal import TransferJournal
 from logger import log
 import tkinter as tk
 from tkinter import messagebox, ttk
-from resources import tone, font
-
-
-@dataclasses.dataclass
-class SerialPortCheckResult:
-    status: bool
-    message: str
-    firmware_version: int
-    eeprom_size: int
-    raw_version_text: str
 
-
-def get_all_serial_port():
-    ports = serial.tools.list_ports.comports()
-    ports = [port.device for port in ports]
-    log('可用串口: ' + str(ports))
-    return ports
+_runner: Optional[JobRunner] = None
 
 
 def serial_port_combo_postcommand(combo: ttk.Combobox):
@@ -40,97 +23,114 @@ def todo_function():
     return
 
 
-def check_eeprom_writeable(serial_port: serial.Serial, addr: int) -> bool:
-    # 读取原始数据
-    read_data = serial_utils.read_extra_eeprom(serial_port, addr, 8)
-    # 写入随机数据
-    random_bytes = bytes([random.randint(0, 255) for _ in range(8)])
-    serial_utils.write_extra_eeprom(serial_port, addr, random_bytes)
-    # 读取写入的数据
-    read_write_data = serial_utils.read_extra_eeprom(serial_port, addr, 8)
-    # 恢复原始数据
-    serial_utils.write_extra_eeprom(serial_port, addr, read_data)
+def _job_error(e: Exception):
+    if isinstance(e, JobCancelled):
+        log('操作已取消')
+        messagebox.showinfo('提示', '操作已取消')
+        return
+    log(f'操作失败: {e}')
+    messagebox.showerror('错误', str(e))
+
+
+def _submit(window: tk.Tk, progress: ttk.Progressbar, status_label: tk.Label, title: str,
+            work: Callable[[operations.ProgressCallback], Any], on_done: Optional[Callable[[Any], None]] = None):
+    """在后台线程中执行 work, 同一时间只允许一个设备操作"""
+    global _runner
+    if _runner is None or _runner.window is not window:
+        _runner = JobRunner(window, progress, status_label)
+    if not _runner.submit(title, work, on_done, _job_error):
+        messagebox.showinfo('提示', '当前有操作正在进行，请等待完成或取消后再试')
+
+
+def cancel_job():
+    if _runner is not None:
+        _runner.cancel()
+
 
-    return read_write_data == random_bytes
+@contextlib.contextmanager
+def _open_session(serial_port_text: str) -> Iterator[operations.RadioSession]:
+    """在后台线程中打开会话并握手, 连接失败时抛出异常"""
+    with operations.RadioSession(serial_port_text) as session:
+        if not session.check.status:
+            raise Exception(session.check.message)
+        yield session
 
 
-def check_serial_port(serial_port: serial.Serial,
-                      auto_detect: bool = True) -> SerialPortCheckResult:
+def _check_port_selected(serial_port_text: str) -> bool:
+    if len(serial_port_text) == 0:
+        log('没有选择串口！')
+        messagebox.showerror('错误', '没有选择串口！')
+        return False
+    return True
+
+
+def _check_extended(eeprom_size: int, firmware_version: int, min_eeprom_size: int, target: str) -> bool:
+    log(f'选择固件版本: {FIRMWARE_VERSION_LIST[firmware_version]} EEPROM大小: {EEPROM_SIZE[eeprom_size]}')
     try:
-        version = serial_utils.sayhello(serial_port)
-        eeprom_size = 0
-        if auto_detect:
-            if version.startswith('LOSEHU'):
-                firmware_version = 0
-                if version.endswith('K') or version.endswith('H'):
-                    firmware_version = 1
-            else:
-                firmware_version = 2
-
-            if firmware_version == 1:
-                # 检查EEPROM大小
-                for i in range(1, 5):
-                    # 128 KiB offset 0x1, 256 KiB offset 0x3, 384 KiB offset 0x5, 512 KiB offset 0x7
-                    # 1 -> 0x1, 2 -> 0x3, 3 -> 0x5, 4 -> 0x7 符合 2n-1
-                    if check_eeprom_writeable(serial_port, (2 * i - 1) * 0x10000 + 0x8000):
-                        eeprom_size = i
-                    else:
-                        break
-            msg = f'串口连接成功！\n版本号: {version}\n自动检测结果如下:\n固件版本: {FIRMWARE_VERSION_LIST[firmware_version]}\n'
-            if firmware_version != 1:
-                msg += f'非{FIRMWARE_VERSION_LIST[1]}固件无法自动检测EEPROM大小\n'
-            else:
-                msg += f'EEPROM大小: {EEPROM_SIZE[eeprom_size]}'
-            log(msg)
-        else:
-            msg = f'串口连接成功！\n版本号: {version}\n'
-            log(msg)
-            firmware_version = 2
-            eeprom_size = 0
-        return SerialPortCheckResult(True, msg, firmware_version, eeprom_size, version)
+        operations.require_extended(firmware_version, eeprom_size, min_eeprom_size, target)
     except Exception as e:
-        msg = '串口连接失败！<-' + str(e)
-        log(msg)
-        return SerialPortCheckResult(False, msg, 2, 0, '')
+        log(str(e))
+        messagebox.showinfo('未扩容固件' if firmware_version != 1 else 'EEPROM大小不足', str(e))
+        return False
+    return True
+
+
+def _ask_save_path() -> Optional[str]:
+    # 读取前先选择保存位置, 数据边读取边写入文件
+    file_path = filedialog.asksaveasfilename(defaultextension=".bin",
+                                             filetypes=[("Binary files", "*.bin"), ("All files", "*.*")])
+
+    if not file_path:
+        log('用户取消保存')
+        messagebox.showinfo('提示', '用户取消保存')
+        return None  # 用户取消保存，直接返回
+    return file_path
+
+
+def _saved(success_log: str) -> Callable[[Any], None]:
+    def done(_):
+        log(success_log)
+        messagebox.showinfo('提示', '保存成功！')
+    return done
+
+
+def _open_file() -> Optional[bytes]:
+    file_path = filedialog.askopenfilename(filetypes=[("Binary files", "*.bin"), ("All files", "*.*")])
+
+    if not file_path:
+        log('用户取消选择')
+        messagebox.showinfo('提示', '用户取消选择')
+        return None  # 用户取消选择，直接返回
+
+    with open(file_path, 'rb') as fp:
+        return fp.read()
+
+
+def _journal(serial_port_text: str, start_addr: int, data: bytes) -> TransferJournal:
+    """有上次中断的相同写入时询问是否从中断处继续"""
+    journal = TransferJournal(serial_port_text)
+    resume_offset = journal.pending(start_addr, data)
+    if resume_offset > 0:
+        journal.resume = messagebox.askquestion(
+            '提示', f'检测到上次未完成的写入 (已写入 {resume_offset}/{len(data)} 字节)，是否从中断处继续？') == 'yes'
+    return journal
 
 
 def serial_port_combo_callback(_, serial_port: str, status_label: tk.Label, eeprom_size_combo: ttk.Combobox,
-                               firmware_combo: ttk.Combobox):
-    status_label['text'] = '当前操作: 检查串口连接'
-    with serial.Serial(serial_port, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port)
+                               firmware_combo: ttk.Combobox, window: tk.Tk, progress: ttk.Progressbar):
+    def work(_on_progress):
+        with operations.RadioSession(serial_port, True) as session:
+            return session.check
+
+    def done(serial_check: SerialPortCheckResult):
         if serial_check.status:
             messagebox.showinfo('提示', serial_check.message)
         else:
             messagebox.showerror('错误', serial_check.message)
         firmware_combo.set(FIRMWARE_VERSION_LIST[serial_check.firmware_version])
         eeprom_size_combo.set(EEPROM_SIZE[serial_check.eeprom_size])
-    status_label['text'] = '当前操作: 无'
-
-
-def write_data(serial_port: Serial, start_addr: int, data: Union[bytes, List[int]],
-               progress: ttk.Progressbar, window: tk.Tk, step: int = 128):
-    data_len = len(data)
-    total_page = data_len // 128
-    addr = start_addr
-    current_step = 0
-    while addr < start_addr + data_len:
-        percent_float = (current_step / total_page) * 100
-        percent = int(percent_float)
-        progress['value'] = percent
-        log(f'进度: {percent_float:.1f}%, addr={hex(addr)}', '')
-        window.update()
-
-        writing_data = bytes(data[:step])
-        data = data[step:]
-        if start_addr + data_len < 0x10000:
-            serial_utils.write_eeprom(serial_port, addr, writing_data)
-        else:
-            serial_utils.write_extra_eeprom(serial_port, addr, writing_data)
-        addr += step
-        current_step += 1
-    progress['value'] = 0
-    window.update()
+
+    _submit(window, progress, status_label, '检查串口连接', work, done)
 
 
 def clean_eeprom(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar, status_label: tk.Label,
@@ -145,580 +145,302 @@ def clean_eeprom(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar
     if messagebox.askquestion('警告', '该操作会清空EEPROM内所有数据(包括设置、信道、校准、字库等)\n确定清空EEPROM请点击否') == 'yes':
         return
 
-    status_label['text'] = '当前操作: 清空EEPROM'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
         return
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-        log(f'选择固件版本: {FIRMWARE_VERSION_LIST[firmware_version]} EEPROM大小: {EEPROM_SIZE[eeprom_size]}')
-        if firmware_version != 1:
-            msg = f'非{FIRMWARE_VERSION_LIST[1]}固件，部分扇区可能无法被清除 (仅清除前8KiB原厂大小数据)'
-            log(msg)
-            messagebox.showinfo('未扩容固件', msg)
-            for i in range(0, 64):
-                percent_float = (i + 1) / 64 * 100
-                percent = int(percent_float)
-                progress['value'] = percent
-                log(f'进度: {percent_float:.1f}%, offset={hex(i * 128)}', '')
-                window.update()
-                serial_utils.write_eeprom(serial_port, i * 128, b'\xff' * 128)
-        else:
-            target_eeprom_offset = 0x2000
-            if eeprom_size > 0:
-                target_eeprom_offset = 0x20000 * eeprom_size
-            write_data(serial_port, 0, b'\xff' * target_eeprom_offset, progress, window)
-        progress['value'] = 0
-        window.update()
+    log(f'选择固件版本: {FIRMWARE_VERSION_LIST[firmware_version]} EEPROM大小: {EEPROM_SIZE[eeprom_size]}')
+    if firmware_version != 1:
+        msg = f'非{FIRMWARE_VERSION_LIST[1]}固件，部分扇区可能无法被清除 (仅清除前8KiB原厂大小数据)'
+        log(msg)
+        messagebox.showinfo('未扩容固件', msg)
+
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.clean_eeprom(session.serial_port, eeprom_size, firmware_version, on_progress)
+            session.reset_radio()
+
+    def done(_):
         log('清空EEPROM成功！')
-        serial_utils.reset_radio(serial_port)
         messagebox.showinfo('提示', '清空EEPROM成功！')
-        status_label['text'] = '当前操作: 无'
+
+    _submit(window, progress, status_label, '清空EEPROM', work, done)
 
 
 def write_font(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar, status_label: tk.Label,
-               eeprom_size: int, firmware_version: int, font_type: FontType, is_continue: bool = False):
+               eeprom_size: int, firmware_version: int, font_type: FontType, skip_unchanged: bool = False,
+               verify: bool = False):
     log('开始写入字库流程')
     log(f'字库版本: {font_type.value}')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 写入字库 ({font_type.value})'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
+        return
+    if not _check_extended(eeprom_size, firmware_version, 2 if font_type == FontType.GB2312_UNCOMPRESSED else 1,
+                           '字库'):
         return
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        log(f'选择固件版本: {FIRMWARE_VERSION_LIST[firmware_version]} EEPROM大小: {EEPROM_SIZE[eeprom_size]}')
-
-        if firmware_version != 1:
-            msg = f'非{FIRMWARE_VERSION_LIST[1]}固件，无法写入字库！'
-            log(msg)
-            messagebox.showinfo('未扩容固件', msg)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        if eeprom_size < 1:
-            msg = f'EEPROM小于128KiB，无法写入字库！'
-            log(msg)
-            messagebox.showinfo('EEPROM大小不足', msg)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        if font_type == FontType.GB2312_UNCOMPRESSED and eeprom_size < 2:
-            msg = f'EEPROM小于256KiB，无法写入H固件字库！'
-            log(msg)
-            messagebox.showinfo('EEPROM大小不足', msg)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        addr = 0x2E00
-        if font_type == FontType.GB2312_COMPRESSED:
-            font_data = font.GB2312_COMPRESSED
-        elif font_type == FontType.GB2312_UNCOMPRESSED:
-            font_data = font.GB2312_UNCOMPRESSED
-        elif font_type == FontType.LOSEHU_FONT:
-            font_data = font.LOSEHU_FONT
-            addr = 0x2000
-        else:
-            messagebox.showerror('错误', '未知字库类型！')
-            status_label['text'] = '当前操作: 无'
-            return
-        write_data(serial_port, addr, font_data, progress, window)
-        progress['value'] = 0
-        window.update()
+    addr, data = operations.font_data(font_type)
+    journal = _journal(serial_port_text, addr, data)
+
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.write_font(session.serial_port, font_type, on_progress, skip_unchanged, journal, verify)
+            session.reset_radio()
+
+    def done(_):
         log('写入字库成功！')
-        if not is_continue:
-            serial_utils.reset_radio(serial_port)
-            messagebox.showinfo('提示', '写入字库成功！')
-        status_label['text'] = '当前操作: 无'
+        messagebox.showinfo('提示', '写入字库成功！')
+
+    _submit(window, progress, status_label, f'写入字库 ({font_type.value})', work, done)
 
 
 def write_font_conf(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar, status_label: tk.Label,
-                    eeprom_size: int, firmware_version: int, is_continue: bool = False):
+                    eeprom_size: int, firmware_version: int, verify: bool = False):
     log('开始写入字库配置')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 写入字库配置'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
+        return
+    if not _check_extended(eeprom_size, firmware_version, 1, '字库配置'):
         return
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        log(f'选择固件版本: {FIRMWARE_VERSION_LIST[firmware_version]} EEPROM大小: {EEPROM_SIZE[eeprom_size]}')
-
-        if firmware_version != 1:
-            msg = f'非{FIRMWARE_VERSION_LIST[1]}固件，无法写入字库配置！'
-            log(msg)
-            messagebox.showinfo('未扩容固件', msg)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        if eeprom_size < 1:
-            msg = f'EEPROM小于128KiB，无法写入字库配置！'
-            log(msg)
-            messagebox.showinfo('EEPROM大小不足', msg)
-            status_label['text'] = '当前操作: 无'
-            return
-        write_data(serial_port, 0x2480, font.FONT_CONF, progress, window)
-        progress['value'] = 0
-        window.update()
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.write_font_conf(session.serial_port, on_progress, verify)
+            session.reset_radio()
+
+    def done(_):
         log('写入字库配置成功！')
-        if not is_continue:
-            serial_utils.reset_radio(serial_port)
-            messagebox.showinfo('提示', '写入字库配置成功！')
-        status_label['text'] = '当前操作: 无'
+        messagebox.showinfo('提示', '写入字库配置成功！')
+
+    _submit(window, progress, status_label, '写入字库配置', work, done)
 
 
 def write_tone_options(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar, status_label: tk.Label,
-                       eeprom_size: int, firmware_version: int, is_continue: bool = False):
+                       eeprom_size: int, firmware_version: int, verify: bool = False):
     log('开始写入亚音参数')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 写入亚音参数'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
+        return
+    if not _check_extended(eeprom_size, firmware_version, 1, '亚音参数'):
         return
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        log(f'选择固件版本: {FIRMWARE_VERSION_LIST[firmware_version]} EEPROM大小: {EEPROM_SIZE[eeprom_size]}')
-
-        if firmware_version != 1:
-            msg = f'非{FIRMWARE_VERSION_LIST[1]}固件，无法写入亚音参数！'
-            log(msg)
-            messagebox.showinfo('未扩容固件', msg)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        if eeprom_size < 1:
-            msg = f'EEPROM小于128KiB，无法写入亚音参数！'
-            log(msg)
-            messagebox.showinfo('EEPROM大小不足', msg)
-            status_label['text'] = '当前操作: 无'
-            return
-        data = b''
-        for tone_data in tone.CTCSS_OPTIONS + tone.DCS_OPTIONS:
-            data += struct.pack('<H', tone_data)
-        write_data(serial_port, 0x2C00, data, progress, window)
-        progress['value'] = 0
-        window.update()
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.write_tone_options(session.serial_port, on_progress, verify)
+            session.reset_radio()
+
+    def done(_):
         log('写入亚音参数成功！')
-        if not is_continue:
-            serial_utils.reset_radio(serial_port)
-            messagebox.showinfo('提示', '写入亚音参数成功！')
-        status_label['text'] = '当前操作: 无'
+        messagebox.showinfo('提示', '写入亚音参数成功！')
+
+    _submit(window, progress, status_label, '写入亚音参数', work, done)
 
 
 # 复位函数
-def reset_radio(serial_port_text: str, status_label):
-    status_label['text'] = '当前操作: 复位设备'
+def reset_radio(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar, status_label: tk.Label):
     log('正在复位设备')
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-        serial_utils.reset_radio(serial_port)
-    status_label['text'] = '当前操作: 无'
+
+    def work(_on_progress):
+        with _open_session(serial_port_text) as session:
+            session.reset_radio()
+
+    _submit(window, progress, status_label, '复位设备', work)
 
 
 # 写入字库等信息的总函数
 def auto_write_font(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar,
-                    status_label: tk.Label, eeprom_size: int, firmware_version: int):
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        result = check_serial_port(serial_port, False)
-        if not result.status:
-            messagebox.showerror('错误', result.message)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        version = result.raw_version_text
-        if version.startswith('LOSEHU'):
-            version_number = int(version[6:9])
-            version_code = version[-1]
-            if version_code == 'H':
-                if version_number == 118:
-                    font_type = FontType.GB2312_UNCOMPRESSED
-                else:
-                    font_type = FontType.GB2312_COMPRESSED
-            elif version_code == 'K':
-                if version_number < 118:
-                    font_type = FontType.LOSEHU_FONT
-                else:
-                    font_type = FontType.GB2312_COMPRESSED
-        else:
-            version_code = 'other'
-    if version_code == 'K' or version_code == 'H':
-        if version_number < 118:
-            log(f'正在进行 写入{version_number}{version_code}版字库')
-            write_font(serial_port_text, window, progress, status_label, eeprom_size, firmware_version, font_type)
-            reset_radio(serial_port_text, status_label)
-            messagebox.showinfo('提示', f'{version_number}{version_code}版本字库\n写入成功')
-        else:
-            n = 4 if version_code == 'H' else 3
+                    status_label: tk.Label, eeprom_size: int, firmware_version: int, skip_unchanged: bool = False,
+                    verify: bool = False):
+    if not _check_port_selected(serial_port_text):
+        return
+
+    # 字库和拼音表数据由固件版本决定, 相同数据的中断写入直接从断点继续 (会先校验断点前的数据)
+    journal = TransferJournal(serial_port_text)
+
+    # 整个流程只打开一次串口并握手一次
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            serial_port = session.serial_port
+            plan = operations.auto_font_plan(session.version)
+            if plan is None:
+                raise Exception('非LOSEHU扩容固件，无法写入')
+            version_number, version_code, n = plan.version_number, plan.version_code, plan.steps
+            operations.require_extended(firmware_version, eeprom_size,
+                                        2 if plan.font_type == FontType.GB2312_UNCOMPRESSED else 1, '字库')
+            if not plan.write_font_conf:
+                log(f'正在进行 写入{version_number}{version_code}版字库')
+                operations.write_font(serial_port, plan.font_type, on_progress, skip_unchanged, journal, verify)
+                session.reset_radio()
+                return f'{version_number}{version_code}版本字库\n写入成功'
+
             log(f'正在进行 1/{n}: 写入{version_number}{version_code}版字库')
-            write_font(serial_port_text, window, progress, status_label, eeprom_size, firmware_version, font_type, True)
+            operations.write_font(serial_port, plan.font_type, on_progress, skip_unchanged, journal, verify)
             log(f'正在进行 2/{n}: 写入字库配置')
-            write_font_conf(serial_port_text, window, progress, status_label, eeprom_size, firmware_version, True)
+            operations.write_font_conf(serial_port, on_progress, verify)
             log(f'正在进行 3/{n}: 写入亚音参数')
-            write_tone_options(serial_port_text, window, progress, status_label, eeprom_size, firmware_version, True)
+            operations.write_tone_options(serial_port, on_progress, verify)
             if n == 4:
-                log(f'正在进行 4/4: 写入拼音检索表')
-                if version_number == 123:
-                    write_pinyin_index(serial_port_text, window, progress, status_label, eeprom_size, firmware_version,
-                                       True)
-                elif version_number > 123:
-                    write_pinyin_index(serial_port_text, window, progress, status_label, eeprom_size, firmware_version,
-                                       True, True)
-            reset_radio(serial_port_text, status_label)
+                log('正在进行 4/4: 写入拼音检索表')
+                if plan.pinyin_new is not None:
+                    operations.require_extended(firmware_version, eeprom_size, 2, '拼音检索表')
+                    operations.write_pinyin_index(serial_port, plan.pinyin_new, on_progress, skip_unchanged, journal,
+                                                  verify)
+            session.reset_radio()
             extra_msg = '拼音检索表\n' if n == 4 else ''
-            messagebox.showinfo('提示', f'{version_number}{version_code}版本字库\n字库配置\n亚音参数\n{extra_msg}写入成功！')
-    else:
-        messagebox.showinfo('提示', f'非LOSEHU扩容固件，无法写入')
+            return f'{version_number}{version_code}版本字库\n字库配置\n亚音参数\n{extra_msg}写入成功！'
+
+    def done(msg: str):
+        messagebox.showinfo('提示', msg)
+
+    _submit(window, progress, status_label, '自动写入字库', work, done)
 
 
 def read_calibration(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar,
                      status_label: tk.Label):
     log('开始读取校准参数')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 读取校准参数'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
         return
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        total_steps = (0x2000 - 0x1E00) // 128  # 计算总步数
-        current_step = 0
-        addr = 0x1E00  # 起始地址为0x1E00
-
-        calibration_data = b''
-
-        while addr < 0x2000:  # 限制地址范围为0x1E00到0x1FF0
-            read_data = serial_utils.read_eeprom(serial_port, addr, 128)
-            calibration_data += read_data
-            addr += 128
-            current_step += 1
-            percent_float = (current_step / total_steps) * 100
-            log(f'进度: {percent_float:.1f}%, addr={hex(addr)}', '')
-            progress['value'] = percent_float
-            window.update()
-
-        # 弹出文件保存对话框
-        file_path = filedialog.asksaveasfilename(defaultextension=".bin",
-                                                 filetypes=[("Binary files", "*.bin"), ("All files", "*.*")])
-
-        if not file_path:
-            log('用户取消保存')
-            messagebox.showinfo('提示', '用户取消保存')
-            return  # 用户取消保存，直接返回
-
-        with open(file_path, 'wb') as fp:
-            fp.write(calibration_data)
-
-        log('读取校准参数完成')
-        status_label['text'] = '当前操作: 无'
-        messagebox.showinfo('提示', '保存成功！')
+    file_path = _ask_save_path()
+    if file_path is None:
+        return
+
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.read_calibration_to_file(session.serial_port, file_path, on_progress)
+
+    _submit(window, progress, status_label, '读取校准参数', work, _saved('读取校准参数完成'))
 
 
 def write_calibration(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar,
-                      status_label: tk.Label):
+                      status_label: tk.Label, verify: bool = False):
     log('开始写入校准参数')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 写入校准参数'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
         return
 
-    file_path = filedialog.askopenfilename(filetypes=[("Binary files", "*.bin"), ("All files", "*.*")])
-
-    if not file_path:
-        log('用户取消选择')
-        messagebox.showinfo('提示', '用户取消选择')
-        return  # 用户取消选择，直接返回
-
-    with open(file_path, 'rb') as fp:
-        calibration_data = fp.read()
+    calibration_data = _open_file()
+    if calibration_data is None:
+        return
 
     if len(calibration_data) != 512:
         log('校准参数文件大小错误')
         messagebox.showerror('错误', '校准参数文件大小错误')
-        status_label['text'] = '当前操作: 无'
         return
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        write_data(serial_port, 0x1E00, calibration_data, progress, window)
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.write_calibration(session.serial_port, calibration_data, on_progress, verify)
+            session.reset_radio()
 
+    def done(_):
         log('写入校准参数完成')
-        status_label['text'] = '当前操作: 无'
-        serial_utils.reset_radio(serial_port)
         messagebox.showinfo('提示', '写入成功！')
 
+    _submit(window, progress, status_label, '写入校准参数', work, done)
+
 
 def read_config(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar,
                 status_label: tk.Label):
     log('开始读取配置参数')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 读取配置参数'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
         return
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        total_steps = (0x1D00 - 0x0000) // 128  # 计算总步数
-        current_step = 0
-        addr = 0x0000  # 起始地址为0x0000
-
-        config_data = b''
-
-        while addr < 0x1D00:  # 限制地址范围为0x1E00到0x1FF0
-            read_data = serial_utils.read_eeprom(serial_port, addr, 128)
-            config_data += read_data
-            addr += 128
-            current_step += 1
-            percent_float = (current_step / total_steps) * 100
-            log(f'进度: {percent_float:.1f}%, addr={hex(addr)}', '')
-            progress['value'] = percent_float
-            window.update()
-
-        # 弹出文件保存对话框
-        file_path = filedialog.asksaveasfilename(defaultextension=".bin",
-                                                 filetypes=[("Binary files", "*.bin"), ("All files", "*.*")])
-
-        if not file_path:
-            log('用户取消保存')
-            messagebox.showinfo('提示', '用户取消保存')
-            return  # 用户取消保存，直接返回
-
-        with open(file_path, 'wb') as fp:
-            fp.write(config_data)
-
-        log('读取配置参数完成')
-        status_label['text'] = '当前操作: 无'
-        messagebox.showinfo('提示', '保存成功！')
+    file_path = _ask_save_path()
+    if file_path is None:
+        return
+
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.read_config_to_file(session.serial_port, file_path, on_progress)
+
+    _submit(window, progress, status_label, '读取配置参数', work, _saved('读取配置参数完成'))
 
 
 def write_config(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar,
-                 status_label: tk.Label):
+                 status_label: tk.Label, verify: bool = False):
     log('开始写入配置参数')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 写入配置参数'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
         return
 
-    file_path = filedialog.askopenfilename(filetypes=[("Binary files", "*.bin"), ("All files", "*.*")])
-
-    if not file_path:
-        log('用户取消选择')
-        messagebox.showinfo('提示', '用户取消选择')
-        return  # 用户取消选择，直接返回
-
-    with open(file_path, 'rb') as fp:
-        calibration_data = fp.read()
+    config_data = _open_file()
+    if config_data is None:
+        return
 
-    if len(calibration_data) != 0x1d00:
+    if len(config_data) != 0x1d00:
         log('配置参数文件大小错误')
         messagebox.showerror('错误', '配置参数文件大小错误')
-        status_label['text'] = '当前操作: 无'
         return
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        write_data(serial_port, 0x0, calibration_data, progress, window)
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.write_config(session.serial_port, config_data, on_progress, verify)
+            session.reset_radio()
 
+    def done(_):
         log('写入配置参数完成')
-        status_label['text'] = '当前操作: 无'
-        serial_utils.reset_radio(serial_port)
         messagebox.showinfo('提示', '写入成功！')
 
+    _submit(window, progress, status_label, '写入配置参数', work, done)
+
 
 def write_pinyin_index(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar, status_label: tk.Label,
-                       eeprom_size: int, firmware_version: int, is_continue: bool = False, new: bool = False):
+                       eeprom_size: int, firmware_version: int, new: bool = False, skip_unchanged: bool = False,
+                       verify: bool = False):
     log('开始写入拼音检索表')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 写入拼音检索表'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
         return
-
-    if firmware_version != 1:
-        msg = f'非{FIRMWARE_VERSION_LIST[1]}固件，无法写入拼音检索表！'
-        log(msg)
-        messagebox.showinfo('未扩容固件', msg)
-        status_label['text'] = '当前操作: 无'
+    if not _check_extended(eeprom_size, firmware_version, 2, '拼音检索表'):
         return
 
-    if eeprom_size < 2:
-        msg = f'EEPROM小于256KiB，无法写入拼音检索表！'
-        log(msg)
-        messagebox.showinfo('EEPROM大小不足', msg)
-        status_label['text'] = '当前操作: 无'
-        return
+    addr, data = operations.pinyin_index_data(new)
+    journal = _journal(serial_port_text, addr, data)
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.write_pinyin_index(session.serial_port, new, on_progress, skip_unchanged, journal, verify)
+            session.reset_radio()
 
-        pinyin_data = font.PINYIN_NEW if new else font.PINYIN_OLD
-        addr = 0x20000
-        write_data(serial_port, addr, pinyin_data, progress, window)
+    def done(_):
         log('写入拼音检索表成功！')
-        if not is_continue:
-            serial_utils.reset_radio(serial_port)
-            messagebox.showinfo('提示', '写入拼音检索表成功！')
-        status_label['text'] = '当前操作: 无'
+        messagebox.showinfo('提示', '写入拼音检索表成功！')
+
+    _submit(window, progress, status_label, '写入拼音检索表', work, done)
 
 
 def backup_eeprom(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar,
                   status_label: tk.Label, eeprom_size: int):
     log('开始备份')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 备份eeprom'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
         return
 
-    if eeprom_size > 0:
-        target_eeprom_offset = 0x20000 * eeprom_size
-    else:
-        target_eeprom_offset = 0x2000
-        
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
-
-        start_addr = 0x0  # 起始地址为0x0
-        total_steps = (target_eeprom_offset - start_addr) // 128  # 计算总步数
-        current_step = 0
-        addr = start_addr
-
-        backup_data = b''
-
-        while addr < target_eeprom_offset:  # 限制地址范围为start_addr到target_eeprom_offset
-            if target_eeprom_offset < 0x10000:
-                read_data = serial_utils.read_eeprom(serial_port, addr, 128)
-            else:
-                read_data = serial_utils.read_extra_eeprom(serial_port, addr, 128)
-            backup_data += read_data
-            addr += 128
-            current_step += 1
-            percent_float = (current_step / total_steps) * 100
-            log(f'进度: {percent_float:.1f}%, addr={hex(addr)}', '')
-            progress['value'] = percent_float
-            window.update()
-
-        # 弹出文件保存对话框
-        file_path = filedialog.asksaveasfilename(defaultextension=".bin",
-                                                 filetypes=[("Binary files", "*.bin"), ("All files", "*.*")])
-
-        if not file_path:
-            log('用户取消保存')
-            messagebox.showinfo('提示', '用户取消保存')
-            return  # 用户取消保存，直接返回
-
-        with open(file_path, 'wb') as fp:
-            fp.write(backup_data)
-
-        log('EEPROM 备份完成')
-        status_label['text'] = '当前操作: 无'
-        messagebox.showinfo('提示', '保存成功！')
+    file_path = _ask_save_path()
+    if file_path is None:
+        return
+
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.backup_eeprom_to_file(session.serial_port, eeprom_size, file_path, on_progress)
+
+    _submit(window, progress, status_label, '备份eeprom', work, _saved('EEPROM 备份完成'))
 
 
 def restore_eeprom(serial_port_text: str, window: tk.Tk, progress: ttk.Progressbar,
-                   status_label: tk.Label, eeprom_size: int):
+                   status_label: tk.Label, eeprom_size: int, skip_unchanged: bool = False, verify: bool = False):
     log('开始恢复eeprom')
     log('选择的串口: ' + serial_port_text)
-    status_label['text'] = f'当前操作: 恢复eeprom'
-    if len(serial_port_text) == 0:
-        log('没有选择串口！')
-        messagebox.showerror('错误', '没有选择串口！')
-        status_label['text'] = '当前操作: 无'
+    if not _check_port_selected(serial_port_text):
         return
 
-    start_addr = 0x0
-    if eeprom_size > 0:
-        target_eeprom_offset = 0x20000 * eeprom_size
-    else:
-        target_eeprom_offset = 0x2000
-        
-    file_path = filedialog.askopenfilename(filetypes=[("Binary files", "*.bin"), ("All files", "*.*")])
+    target_eeprom_offset = operations.eeprom_image_size(eeprom_size)
 
-    if not file_path:
-        log('用户取消选择')
-        messagebox.showinfo('提示', '用户取消选择')
-        return  # 用户取消选择，直接返回
-
-    with open(file_path, 'rb') as fp:
-        restore_data = fp.read()
+    restore_data = _open_file()
+    if restore_data is None:
+        return
 
     if len(restore_data) != target_eeprom_offset:
         if messagebox.askquestion('提示', f'选择的文件大小为{len(restore_data)}，但目标eeprom大小为{target_eeprom_offset}，是否继续？') == 'no':
@@ -726,16 +448,16 @@ def restore_eeprom(serial_port_text: str, window: tk.Tk, progress: ttk.Progressb
             messagebox.showinfo('提示', '用户取消恢复')
             return  # 用户取消恢复，直接返回
 
-    with serial.Serial(serial_port_text, 38400, timeout=2) as serial_port:
-        serial_check = check_serial_port(serial_port, False)
-        if not serial_check.status:
-            messagebox.showerror('错误', serial_check.message)
-            status_label['text'] = '当前操作: 无'
-            return
+    journal = _journal(serial_port_text, 0x0, restore_data)
 
-        write_data(serial_port, start_addr, restore_data, progress, window)
+    def work(on_progress):
+        with _open_session(serial_port_text) as session:
+            operations.restore_eeprom(session.serial_port, restore_data, on_progress, skip_unchanged, journal,
+                                      verify)
+            session.reset_radio()
 
+    def done(_):
         log('EEPROM恢复完成')
-        status_label['text'] = '当前操作: 无'
-        serial_utils.reset_radio(serial_port)
-        messagebox.showinfo('提示', '写入成功！')
\ No newline at end of file
+        messagebox.showinfo('提示', '写入成功！')
+
+    _submit(window, progress, status_label, '恢复eeprom', work, done)
@@ -0,0 +1,90 @@
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Callable, Optional
+
+from logger import log
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobRunner:
+    """在后台线程中执行设备操作, 通过队列把进度和结果交回Tk主线程
+
+    work(on_progress) 在后台线程中运行, on_done / on_error 在主线程中调用
+    """
+
+    def __init__(self, window: tk.Tk, progress: ttk.Progressbar, status_label: tk.Label, poll_interval: int = 50):
+        self.window = window
+        self.progress = progress
+        self.status_label = status_label
+        self.poll_interval = poll_interval
+        self._events = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None
+
+    def submit(self, title: str, work: Callable[[Callable[[float, int], None]], Any],
+               on_done: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None) -> bool:
+        if self.busy:
+            return False
+        self._cancel.clear()
+        self.status_label['text'] = f'当前操作: {title}'
+        self._thread = threading.Thread(target=self._run, args=(work, on_done, on_error), daemon=True)
+        self._thread.start()
+        self.window.after(self.poll_interval, self._poll)
+        return True
+
+    def cancel(self):
+        if self.busy:
+            log('正在取消当前操作')
+            self._cancel.set()
+
+    def _on_progress(self, percent: float, addr: int):
+        if self._cancel.is_set():
+            raise JobCancelled('操作已取消')
+        self._events.put(('progress', percent, addr))
+
+    def _run(self, work, on_done, on_error):
+        try:
+            result = work(self._on_progress)
+        except Exception as e:
+            self._events.put(('finish', on_error, e))
+        else:
+            self._events.put(('finish', on_done, result))
+
+    def _poll(self):
+        last_progress = None
+        finish = None
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'progress':
+                last_progress = event
+            else:
+                finish = event
+        # 每次轮询只刷新一次进度, 不随每一页重绘界面
+        if last_progress is not None:
+            _, percent, addr = last_progress
+            self.progress['value'] = percent
+            log(f'进度: {percent:.1f}%, addr={hex(addr)}', '')
+        if finish is None:
+            self.window.after(self.poll_interval, self._poll)
+            return
+
+        self._thread.join()
+        self._thread = None
+        self.progress['value'] = 0
+        self.status_label['text'] = '当前操作: 无'
+        _, callback, value = finish
+        if callback is not None:
+            callback(value)
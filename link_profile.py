@@ -0,0 +1,282 @@
+import dataclasses
+import json
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+import serial.tools.list_ports
+
+import frame_cache
+import serial_utils
+from const_vars import CONFIG_DIR
+from logger import log
+
+LINK_PROFILE_PATH = os.path.join(CONFIG_DIR, 'link_profiles.json')
+# 候选的超时时间 (秒), 从小到大尝试
+TIMEOUT_CANDIDATES = (0.1, 0.25, 0.5, 1.0, 2.0)
+# 超时至少为读写中最慢往返时间的倍数, 流水线读写时排在后面的回复要等前面的帧处理完
+TIMEOUT_MARGIN = 8
+WINDOW_CANDIDATES = (1, 2, 4, 8)
+# 测量往返时间和超时的请求次数
+ROUND_TRIPS = 16
+# 测量读取速度的数据量, 从EEPROM开头读取
+PROFILE_READ_BYTES = 0x1000
+# 测量写入速度时原样写回EEPROM开头这部分数据, 结束后读回确认内容没有变化
+PROFILE_WRITE_BYTES = 0x800
+# 出错比例超过此值的组合不采用
+MAX_ERROR_RATE = 0.01
+# 速度与最快组合相差不超过此比例时, 选择窗口和块更小的组合
+SPEED_TOLERANCE = 0.03
+
+_profiles_lock = threading.Lock()
+
+
+@dataclasses.dataclass
+class LinkProfile:
+    """一种串口适配器的通信参数和测量结果"""
+    timeout: float = 2
+    read_window: int = serial_utils.DEFAULT_READ_WINDOW
+    write_window: int = serial_utils.DEFAULT_WRITE_WINDOW
+    # 读取长度上限, 0 表示使用固件支持的最大长度
+    read_chunk: int = 0
+    rtt_ms: float = 0
+    read_bytes_per_second: float = 0
+    write_bytes_per_second: float = 0
+    error_rate: float = 0
+
+    def as_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+
+@dataclasses.dataclass
+class Trial:
+    """一组参数的测量结果"""
+    window: int
+    chunk: int
+    bytes_per_second: float
+    error_rate: float
+
+
+def adapter_id(port: str) -> Optional[str]:
+    """返回串口适配器的 VID:PID, 不是USB串口或找不到时返回 None"""
+    for info in serial.tools.list_ports.comports():
+        if info.device == port and info.vid is not None:
+            return f'{info.vid:04X}:{info.pid:04X}'
+    return None
+
+
+def _load_profiles() -> dict:
+    try:
+        with open(LINK_PROFILE_PATH, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_profile(adapter: str) -> Optional[LinkProfile]:
+    record = _load_profiles().get(adapter)
+    if record is None:
+        return None
+    fields = {field.name for field in dataclasses.fields(LinkProfile)}
+    return LinkProfile(**{key: value for key, value in record.items() if key in fields})
+
+
+def save_profile(adapter: str, profile: LinkProfile):
+    with _profiles_lock:
+        profiles = _load_profiles()
+        profiles[adapter] = profile.as_dict()
+        try:
+            os.makedirs(os.path.dirname(LINK_PROFILE_PATH), exist_ok=True)
+            tmp_path = LINK_PROFILE_PATH + '.tmp'
+            with open(tmp_path, 'w') as fp:
+                json.dump(profiles, fp, indent=2)
+            os.replace(tmp_path, LINK_PROFILE_PATH)
+        except OSError as e:
+            log(f'保存串口适配器配置失败: {e}')
+
+
+def apply_profile(serial_port, profile: LinkProfile):
+    serial_port.timeout = profile.timeout
+    windows = serial_utils.pipeline_windows(serial_port)
+    windows.read = profile.read_window
+    windows.write = profile.write_window
+    serial_utils.chunk_sizes(serial_port).read_limit = profile.read_chunk
+
+
+def apply_saved_profile(port: str, serial_port) -> Optional[LinkProfile]:
+    """串口适配器有保存的配置时应用到串口并返回"""
+    adapter = adapter_id(port)
+    profile = load_profile(adapter) if adapter else None
+    if profile is not None:
+        apply_profile(serial_port, profile)
+        log(f'使用串口适配器 {adapter} 的配置: 超时 {profile.timeout} 秒, 读取窗口 {profile.read_window}, '
+            f'写入窗口 {profile.write_window}')
+    return profile
+
+
+def _errors(serial_port) -> int:
+    # 每次重发对应一个出错的帧
+    return serial_utils.link_stats(serial_port).retries
+
+
+def _frames(serial_port) -> int:
+    return serial_utils.link_stats(serial_port).frames_sent
+
+
+def _read_round_trip(serial_port, i: int, chunk: int):
+    serial_utils.read_eeprom(serial_port, i * chunk % PROFILE_READ_BYTES, chunk)
+
+
+def _write_round_trip(serial_port, i: int, data: bytes, chunk: int):
+    # 原样写回读出的数据
+    offset = i * chunk % len(data)
+    serial_utils.write_eeprom(serial_port, offset, data[offset:offset + chunk])
+
+
+def measure_round_trips(serial_port, read_chunk: int, data: bytes, write_chunk: int,
+                        count: int = ROUND_TRIPS) -> List[float]:
+    """逐个发送读取和写入请求, 返回每次的往返时间 (秒); 写入的是 data 在EEPROM开头的原有内容"""
+    times = []
+    for i in range(count):
+        for round_trip in (lambda: _read_round_trip(serial_port, i, read_chunk),
+                           lambda: _write_round_trip(serial_port, i, data, write_chunk)):
+            start = time.perf_counter()
+            round_trip()
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def choose_timeout(serial_port, read_chunk: int, data: bytes, write_chunk: int, rtt: float) -> float:
+    """不重发地逐个读取和写回, 返回没有出错的最小候选超时; 固件写入EEPROM比读取慢, 两者都要满足"""
+    policy = serial_utils.retry_policy(serial_port)
+    serial_utils.set_retry_policy(serial_port, serial_utils.RetryPolicy(max_retries=0))
+    try:
+        for timeout in TIMEOUT_CANDIDATES:
+            if timeout < rtt * TIMEOUT_MARGIN:
+                continue
+            serial_port.timeout = timeout
+            failures = 0
+            for i in range(ROUND_TRIPS):
+                for round_trip in (lambda: _read_round_trip(serial_port, i, read_chunk),
+                                   lambda: _write_round_trip(serial_port, i, data, write_chunk)):
+                    try:
+                        round_trip()
+                    except Exception:
+                        serial_utils.flush_input(serial_port)
+                        failures += 1
+            if failures / (2 * ROUND_TRIPS) <= MAX_ERROR_RATE:
+                return timeout
+            log(f'超时 {timeout} 秒时出错 {failures} 次')
+    finally:
+        serial_utils.set_retry_policy(serial_port, policy)
+    return TIMEOUT_CANDIDATES[-1]
+
+
+def measure_read(serial_port, chunk: int, window: int) -> Trial:
+    errors, frames = _errors(serial_port), _frames(serial_port)
+    start = time.perf_counter()
+    for _ in serial_utils.read_eeprom_pipelined(serial_port, 0, PROFILE_READ_BYTES, chunk, False, window):
+        pass
+    seconds = time.perf_counter() - start
+    sent = max(_frames(serial_port) - frames, 1)
+    return Trial(window, chunk, PROFILE_READ_BYTES / seconds, (_errors(serial_port) - errors) / sent)
+
+
+def measure_write(serial_port, data: bytes, chunk: int, window: int) -> Trial:
+    """把 data 原样写回EEPROM开头, EEPROM的内容不变"""
+    frames = [(offset, frame_cache.encode_write_frame(offset, data[offset:offset + chunk], False, serial_port))
+              for offset in range(0, len(data), chunk)]
+    errors, sent = _errors(serial_port), _frames(serial_port)
+    start = time.perf_counter()
+    for _ in serial_utils.write_eeprom_pipelined(serial_port, frames, False, window):
+        pass
+    seconds = time.perf_counter() - start
+    sent = max(_frames(serial_port) - sent, 1)
+    return Trial(window, chunk, len(data) / seconds, (_errors(serial_port) - errors) / sent)
+
+
+def best_trial(trials: List[Trial]) -> Trial:
+    """出错比例可以接受的组合中速度最快的一个, 都不可接受时取出错最少的; 速度相近时取窗口和块更小的"""
+    acceptable = [trial for trial in trials if trial.error_rate <= MAX_ERROR_RATE]
+    if not acceptable:
+        return min(trials, key=lambda trial: (trial.error_rate, -trial.bytes_per_second))
+    fastest = max(trial.bytes_per_second for trial in acceptable)
+    return min((trial for trial in acceptable if trial.bytes_per_second >= fastest * (1 - SPEED_TOLERANCE)),
+               key=lambda trial: (trial.window, trial.chunk))
+
+
+def _no_progress(percent: float, addr: int):
+    pass
+
+
+def profile_link(serial_port, on_progress: Callable[[float, int], None] = _no_progress) -> LinkProfile:
+    """测量往返时间, 以及各候选超时、窗口和块大小下的读写速度和出错比例, 返回最好的组合
+
+    测量写入速度时只把读出的数据原样写回, 结束后读回确认; 串口的原有设置在测量后恢复
+    """
+    sizes = serial_utils.chunk_sizes(serial_port)
+    windows = serial_utils.pipeline_windows(serial_port)
+    saved = (serial_port.timeout, windows.read, windows.write, sizes.read_limit)
+    sizes.read_limit = 0
+    read_chunks = sorted({serial_utils.DEFAULT_CHUNK_SIZE, sizes.read})
+    write_chunk = sizes.write or serial_utils.DEFAULT_CHUNK_SIZE
+    total = 2 + len(read_chunks) * len(WINDOW_CANDIDATES) + len(WINDOW_CANDIDATES)
+    done = 0
+
+    def step_done():
+        nonlocal done
+        done += 1
+        on_progress(done / total * 100, 0)
+
+    original = serial_utils.read_eeprom_pipelined(serial_port, 0, PROFILE_WRITE_BYTES, write_chunk, False, 1)
+    original = b''.join(page for _, page in original)
+    try:
+        rtt = max(measure_round_trips(serial_port, read_chunks[-1], original, write_chunk))
+        log(f'最长往返时间: {rtt * 1000:.1f} ms')
+        step_done()
+        timeout = choose_timeout(serial_port, read_chunks[-1], original, write_chunk, rtt)
+        serial_port.timeout = timeout
+        log(f'超时: {timeout} 秒')
+        step_done()
+
+        reads = []
+        for chunk in read_chunks:
+            for window in WINDOW_CANDIDATES:
+                trial = measure_read(serial_port, chunk, window)
+                log(f'读取: 块 {chunk} 字节, 窗口 {window}, {trial.bytes_per_second / 1024:.1f} KiB/s, '
+                    f'出错比例 {trial.error_rate:.3f}')
+                reads.append(trial)
+                step_done()
+
+        writes = []
+        for window in WINDOW_CANDIDATES:
+            trial = measure_write(serial_port, original, write_chunk, window)
+            log(f'写入: 块 {write_chunk} 字节, 窗口 {window}, {trial.bytes_per_second / 1024:.1f} KiB/s, '
+                f'出错比例 {trial.error_rate:.3f}')
+            writes.append(trial)
+            step_done()
+
+        read, write = best_trial(reads), best_trial(writes)
+        return LinkProfile(
+            timeout=timeout,
+            read_window=read.window,
+            write_window=write.window,
+            read_chunk=0 if read.chunk == sizes.read else read.chunk,
+            rtt_ms=round(rtt * 1000, 3),
+            read_bytes_per_second=round(read.bytes_per_second, 1),
+            write_bytes_per_second=round(write.bytes_per_second, 1),
+            error_rate=round(max(read.error_rate, write.error_rate), 4),
+        )
+    finally:
+        serial_port.timeout, windows.read, windows.write, sizes.read_limit = saved
+        _restore(serial_port, original)
+
+
+def _restore(serial_port, original: bytes):
+    """读回测量写入的区域, 与原始数据不同的页逐包重新写入"""
+    step = serial_utils.DEFAULT_CHUNK_SIZE
+    for addr, page in serial_utils.read_eeprom_pipelined(serial_port, 0, len(original), step, False, 1):
+        if page != original[addr:addr + step]:
+            log(f'测量写入后 {hex(addr)} 处的数据不一致, 重新写入')
+            serial_utils.write_eeprom(serial_port, addr, original[addr:addr + step])
@@ -1,4 +1,5 @@
 import os
+import queue
 import sys
 import tkinter as tk
 from tkinter import messagebox
@@ -21,7 +22,7 @@ from functions import (
     read_config, 
     write_config, 
     write_pinyin_index,
-    todo_function,
+    cancel_job,
     backup_eeprom,
     restore_eeprom
 )
@@ -109,17 +110,32 @@ class Tooltip(object):
 
 
 class TextRedirector(tk.Text):
-    def __init__(self, widget):
+    # 后台线程也会输出日志, 先放入队列, 由主线程定时写入文本框
+    def __init__(self, widget, poll_interval: int = 50):
         super().__init__()
         self.widget = widget
+        self.poll_interval = poll_interval
+        self._pending = queue.Queue()
+        self.widget.after(self.poll_interval, self._drain)
 
     def write(self, strs):
-        self.widget.insert(tk.END, strs)
-        self.widget.see(tk.END)
+        self._pending.put(strs)
 
     def flush(self):
         pass
 
+    def _drain(self):
+        chunks = []
+        while True:
+            try:
+                chunks.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        if chunks:
+            self.widget.insert(tk.END, ''.join(chunks))
+            self.widget.see(tk.END)
+        self.widget.after(self.poll_interval, self._drain)
+
 
 def make_readonly(_):
     return 'break'
@@ -216,7 +232,7 @@ def main():
     serial_port_combo.bind(
         '<<ComboboxSelected>>',
         lambda event: serial_port_combo_callback(
-            event, serial_port_combo.get(), label2, eeprom_size_combo, firmware_combo
+            event, serial_port_combo.get(), label2, eeprom_size_combo, firmware_combo, window, progress
         )
     )
     serial_port_combo.pack(side='left', padx=(1, 3), pady=2)
@@ -233,6 +249,18 @@ def main():
     firmware_combo = ttk.Combobox(frame3, values=FIRMWARE_VERSION_LIST, width=10, state='readonly')
     firmware_combo.pack(side='left', padx=(1, 3))
 
+    skip_unchanged_var = tk.BooleanVar(value=False)
+    skip_unchanged_check = ttk.Checkbutton(
+        frame3, text=translations[language]['skip_unchanged_check_text'], variable=skip_unchanged_var
+    )
+    skip_unchanged_check.pack(side='left', padx=(1, 3))
+
+    verify_var = tk.BooleanVar(value=False)
+    verify_check = ttk.Checkbutton(
+        frame3, text=translations[language]['verify_check_text'], variable=verify_var
+    )
+    verify_check.pack(side='left', padx=(1, 3))
+
     # 第四行
     frame4 = tk.Frame(window, padx=10, pady=2)
     frame4.grid(row=3, column=0, sticky='we')
@@ -254,7 +282,8 @@ def main():
         width=14,
         command=lambda: auto_write_font(
             serial_port_combo.get(), window, progress, label2,
-            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get())
+            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get()),
+            skip_unchanged_var.get(), verify_var.get()
         )
     )
     auto_write_font_button.pack(side='left', padx=3, pady=(15, 2), expand=True, fill='x')
@@ -274,7 +303,7 @@ def main():
         text=translations[language]['write_calibration_button_text'],
         width=14,
         command=lambda: write_calibration(
-            serial_port_combo.get(), window, progress, label2
+            serial_port_combo.get(), window, progress, label2, verify_var.get()
         )
     )
     write_calibration_button.pack(side='left', padx=3, pady=(15, 2), expand=True, fill='x')
@@ -298,7 +327,7 @@ def main():
         text=translations[language]['write_config_button_text'],
         width=14,
         command=lambda: write_config(
-            serial_port_combo.get(), window, progress, label2
+            serial_port_combo.get(), window, progress, label2, verify_var.get()
         )
     )
     write_config_button.pack(side='left', padx=3, pady=2, expand=True, fill='x')
@@ -309,7 +338,8 @@ def main():
         width=14,
         command=lambda: write_font_conf(
             serial_port_combo.get(), window, progress, label2,
-            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get())
+            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get()),
+            verify_var.get()
         )
     )
     write_font_conf_button.pack(side='left', padx=3, pady=2, expand=True, fill='x')
@@ -320,7 +350,8 @@ def main():
         width=14,
         command=lambda: write_tone_options(
             serial_port_combo.get(), window, progress, label2,
-            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get())
+            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get()),
+            verify_var.get()
         )
     )
     write_tone_options_button.pack(side='left', padx=3, pady=2, expand=True, fill='x')
@@ -336,7 +367,7 @@ def main():
         command=lambda: write_font(
             serial_port_combo.get(), window, progress, label2,
             EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get()),
-            FontType.GB2312_COMPRESSED
+            FontType.GB2312_COMPRESSED, skip_unchanged=skip_unchanged_var.get(), verify=verify_var.get()
         )
     )
     write_font_compressed_button.pack(side='left', padx=3, pady=2, expand=True, fill='x')
@@ -348,7 +379,7 @@ def main():
         command=lambda: write_font(
             serial_port_combo.get(), window, progress, label2,
             EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get()),
-            FontType.GB2312_UNCOMPRESSED
+            FontType.GB2312_UNCOMPRESSED, skip_unchanged=skip_unchanged_var.get(), verify=verify_var.get()
         )
     )
     write_font_uncompressed_button.pack(side='left', padx=3, pady=2, expand=True, fill='x')
@@ -360,7 +391,7 @@ def main():
         command=lambda: write_font(
             serial_port_combo.get(), window, progress, label2,
             EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get()),
-            FontType.LOSEHU_FONT
+            FontType.LOSEHU_FONT, skip_unchanged=skip_unchanged_var.get(), verify=verify_var.get()
         )
     )
     write_font_old_button.pack(side='left', padx=3, pady=2, expand=True, fill='x')
@@ -371,7 +402,8 @@ def main():
         width=14,
         command=lambda: write_pinyin_index(
             serial_port_combo.get(), window, progress, label2,
-            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get())
+            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get()),
+            skip_unchanged=skip_unchanged_var.get(), verify=verify_var.get()
         )
     )
     write_pinyin_old_index_button.pack(side='left', padx=3, pady=2, expand=True, fill='x')
@@ -385,7 +417,8 @@ def main():
         width=14,
         command=lambda: write_pinyin_index(
             serial_port_combo.get(), window, progress, label2,
-            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get()), False, True
+            EEPROM_SIZE.index(eeprom_size_combo.get()), FIRMWARE_VERSION_LIST.index(firmware_combo.get()), True,
+            skip_unchanged_var.get(), verify_var.get()
         )
     )
     write_pinyin_new_index_button.pack(side='left', padx=3, pady=(2, 15), expand=True, fill='x')
@@ -405,18 +438,19 @@ def main():
         text=translations[language]['restore_eeprom_button_text'],
         width=14,
         command=lambda:restore_eeprom(
-            serial_port_combo.get(), window, progress, label2,EEPROM_SIZE.index(eeprom_size_combo.get())
+            serial_port_combo.get(), window, progress, label2,EEPROM_SIZE.index(eeprom_size_combo.get()),
+            skip_unchanged_var.get(), verify_var.get()
         )
     )
     restore_eeprom_button.pack(side='left', padx=3, pady=(2, 15), expand=True, fill='x')
     
-    todo_button = tk.Button(
+    cancel_button = tk.Button(
         frame7,
-        text=translations[language]['todo_button_text'],
+        text=translations[language]['cancel_button_text'],
         width=14,
-        command=todo_function
+        command=cancel_job
     )
-    todo_button.pack(side='left', padx=3, pady=(2, 15), expand=True, fill='x')
+    cancel_button.pack(side='left', padx=3, pady=(2, 15), expand=True, fill='x')
     
     # 第八行
     frame8 = tk.Frame(window, padx=10, pady=2)
@@ -442,6 +476,8 @@ def main():
     Tooltip(language_combo, translations[language]['language_combo_tooltip_text'])
     Tooltip(eeprom_size_combo, translations[language]['eeprom_size_combo_tooltip_text'])
     Tooltip(firmware_combo, translations[language]['firmware_combo_tooltip_text'])
+    Tooltip(skip_unchanged_check, translations[language]['skip_unchanged_check_tooltip_text'])
+    Tooltip(verify_check, translations[language]['verify_check_tooltip_text'])
     Tooltip(serial_port_combo, translations[language]['serial_port_combo_tooltip_text'])
     Tooltip(clean_eeprom_button, translations[language]['clean_eeprom_button_tooltip_text'])
     Tooltip(auto_write_font_button, translations[language]['auto_write_font_button_tooltip_text'])
@@ -458,7 +494,7 @@ def main():
     Tooltip(write_pinyin_new_index_button, translations[language]['write_pinyin_new_index_button_tooltip_text'])
     Tooltip(backup_eeprom_button, translations[language]['backup_eeprom_button_tooltip_text'])
     Tooltip(restore_eeprom_button, translations[language]['restore_eeprom_button_tooltip_text'])
-    Tooltip(todo_button, translations[language]['todo_button_tooltip_text'])
+    Tooltip(cancel_button, translations[language]['cancel_button_tooltip_text'])
 
     window.mainloop()
 
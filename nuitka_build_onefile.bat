@@ -1 +1 @@
-nuitka --standalone --onefile --windows-disable-console --enable-plugin=tk-inter main.py
\ No newline at end of file
+nuitka --standalone --onefile --windows-disable-console --enable-plugin=tk-inter --include-data-dir=resources/font_data=resources/font_data main.py
\ No newline at end of file
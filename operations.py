@@ -0,0 +1,753 @@
+import dataclasses
+import hashlib
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+import serial.tools.list_ports
+from serial import Serial
+
+import chunk_probe
+import file_utils
+import frame_cache
+import link_profile
+import serial_utils
+import wire_capture
+from frame_trace import FrameTracer
+from transfer_journal import TransferJournal
+from const_vars import CONFIG_DIR, FIRMWARE_VERSION_LIST, EEPROM_SIZE, FontType
+from logger import log
+from resources import font, tone
+
+# 进度回调 (百分比, 当前地址)
+ProgressCallback = Callable[[float, int], None]
+# 可以按偏移直接切分的数据
+BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+# 要写入的数据: 整块缓冲区或逐页的迭代器
+PageSource = Union[bytes, bytearray, memoryview, mmap.mmap, Iterable[Union[bytes, memoryview]]]
+
+# EEPROM大小检测: EEPROM_SIZE 中序号 i 对应的容量, 超过该容量的地址回绕到芯片开头
+SIZE_BOUNDARIES = [0x2000, 0x20000, 0x40000, 0x60000]
+# 用作比较的参考页 (校准参数), 同时作为缓存的设备指纹
+SIZE_PROBE_ADDR = 0x1E00
+SIZE_PROBE_LENGTH = 128
+EEPROM_SIZE_CACHE_PATH = os.path.join(CONFIG_DIR, 'eeprom_size_cache.json')
+_size_cache_lock = threading.Lock()
+
+
+@dataclasses.dataclass
+class SerialPortCheckResult:
+    status: bool
+    message: str
+    firmware_version: int
+    eeprom_size: int
+    raw_version_text: str
+
+
+@dataclasses.dataclass
+class AutoFontPlan:
+    version_number: int
+    version_code: str
+    font_type: FontType
+    # 118 及之后的版本还需要写入字库配置和亚音参数
+    write_font_conf: bool
+    # None 为不写入拼音表, 否则为是否写入新版拼音表
+    pinyin_new: Optional[bool]
+    steps: int
+
+
+@dataclasses.dataclass
+class VerifyResult:
+    pages: int
+    # 不一致的页相对起始地址的偏移
+    mismatched: List[int]
+    expected_sha256: str
+    read_sha256: str
+    rewritten: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.mismatched
+
+
+def _no_progress(percent: float, addr: int):
+    pass
+
+
+def get_all_serial_port():
+    ports = serial.tools.list_ports.comports()
+    ports = [port.device for port in ports]
+    log('可用串口: ' + str(ports))
+    return ports
+
+
+def firmware_version_of(version: str) -> int:
+    """返回 FIRMWARE_VERSION_LIST 中的固件类型序号"""
+    if version.startswith('LOSEHU'):
+        if version.endswith('K') or version.endswith('H'):
+            return 1
+        return 0
+    return 2
+
+
+def check_eeprom_writeable(serial_port: Serial, addr: int) -> bool:
+    # 读取原始数据
+    read_data = serial_utils.read_extra_eeprom(serial_port, addr, 8)
+    # 写入随机数据
+    random_bytes = bytes([random.randint(0, 255) for _ in range(8)])
+    serial_utils.write_extra_eeprom(serial_port, addr, random_bytes)
+    # 读取写入的数据
+    read_write_data = serial_utils.read_extra_eeprom(serial_port, addr, 8)
+    # 恢复原始数据
+    serial_utils.write_extra_eeprom(serial_port, addr, read_data)
+
+    return read_write_data == random_bytes
+
+
+def _read_probe(serial_port: Serial, addr: int, length: int = SIZE_PROBE_LENGTH) -> bytes:
+    return serial_utils.read_extra_eeprom(serial_port, addr, length)
+
+
+def _detect_by_alias(serial_port: Serial, reference: bytes) -> int:
+    # 第一个与参考页内容相同的镜像位置即为容量边界
+    for i, boundary in enumerate(SIZE_BOUNDARIES):
+        if _read_probe(serial_port, SIZE_PROBE_ADDR + boundary, len(reference)) == reference:
+            return i
+    return len(SIZE_BOUNDARIES)
+
+
+def _detect_by_write(serial_port: Serial) -> int:
+    """从大到小在每个容量独有的区域写入并读回, 返回第一个可以写入的容量的序号"""
+    for i in range(len(SIZE_BOUNDARIES), 0, -1):
+        try:
+            writeable = check_eeprom_writeable(serial_port, SIZE_BOUNDARIES[i - 1] + SIZE_PROBE_ADDR)
+        except Exception as e:
+            log(f'写入检测 {EEPROM_SIZE[i]} 失败 <-{e}')
+            serial_utils.flush_input(serial_port)
+            writeable = False
+        if writeable:
+            return i
+    return 0
+
+
+def _size_cache_consistent(serial_port: Serial, reference: bytes, eeprom_size: int) -> bool:
+    # 只用读取确认缓存的大小: 该大小的边界处应当回绕, 上一个边界处不应回绕
+    if eeprom_size < len(SIZE_BOUNDARIES):
+        if _read_probe(serial_port, SIZE_PROBE_ADDR + SIZE_BOUNDARIES[eeprom_size]) != reference:
+            return False
+    if eeprom_size > 0:
+        if _read_probe(serial_port, SIZE_PROBE_ADDR + SIZE_BOUNDARIES[eeprom_size - 1]) == reference:
+            return False
+    return True
+
+
+def _load_size_cache() -> dict:
+    try:
+        with open(EEPROM_SIZE_CACHE_PATH, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_size_cache(key: str, eeprom_size: int):
+    with _size_cache_lock:
+        cache = _load_size_cache()
+        cache[key] = eeprom_size
+        try:
+            os.makedirs(os.path.dirname(EEPROM_SIZE_CACHE_PATH), exist_ok=True)
+            tmp_path = EEPROM_SIZE_CACHE_PATH + '.tmp'
+            with open(tmp_path, 'w') as fp:
+                json.dump(cache, fp)
+            os.replace(tmp_path, EEPROM_SIZE_CACHE_PATH)
+        except OSError as e:
+            log(f'保存EEPROM大小缓存失败: {e}')
+
+
+def detect_eeprom_size(serial_port: Serial, version: str) -> int:
+    """通过地址回绕检测EEPROM大小, 返回 EEPROM_SIZE 中的序号
+
+    EEPROM 在超出容量的地址上会回绕到芯片开头, 比较校准参数页与其在各个容量边界之上的镜像即可判断大小,
+    只有参考页为空白时才需要写入一次标记. 有的EEPROM超出容量时不应答而不是回绕, 所有边界都没有镜像时
+    无法区分, 再用最少的写入检测确认. 结果以固件版本和校准参数页 (每台电台不同) 为键缓存
+    """
+    reference = _read_probe(serial_port, SIZE_PROBE_ADDR)
+    key = f'{version}:{hashlib.sha256(reference).hexdigest()[:16]}'
+    cacheable = len(set(reference)) > 1
+    if cacheable:
+        cached = _load_size_cache().get(key)
+        if cached is not None and _size_cache_consistent(serial_port, reference, cached):
+            log(f'使用缓存的EEPROM大小: {EEPROM_SIZE[cached]}')
+            return cached
+
+    if cacheable:
+        eeprom_size = _detect_by_alias(serial_port, reference)
+    else:
+        # 参考页为空白 (如新换的EEPROM), 临时写入随机标记作为参考, 检测后恢复
+        marker = bytes([random.randint(0, 255) for _ in range(8)])
+        while len(set(marker)) == 1:
+            marker = bytes([random.randint(0, 255) for _ in range(8)])
+        serial_utils.write_extra_eeprom(serial_port, SIZE_PROBE_ADDR, marker)
+        try:
+            eeprom_size = _detect_by_alias(serial_port, marker)
+        finally:
+            serial_utils.write_extra_eeprom(serial_port, SIZE_PROBE_ADDR, reference[:len(marker)])
+    if eeprom_size == len(SIZE_BOUNDARIES):
+        log('所有容量边界都没有地址回绕, 用写入检测确认EEPROM大小')
+        eeprom_size = _detect_by_write(serial_port)
+    if cacheable:
+        _save_size_cache(key, eeprom_size)
+    return eeprom_size
+
+
+def check_serial_port(serial_port: Serial,
+                      auto_detect: bool = True) -> SerialPortCheckResult:
+    try:
+        version = serial_utils.sayhello(serial_port)
+        eeprom_size = 0
+        if auto_detect:
+            firmware_version = firmware_version_of(version)
+
+            if firmware_version == 1:
+                # 检查EEPROM大小
+                eeprom_size = detect_eeprom_size(serial_port, version)
+            msg = f'串口连接成功！\n版本号: {version}\n自动检测结果如下:\n固件版本: {FIRMWARE_VERSION_LIST[firmware_version]}\n'
+            if firmware_version != 1:
+                msg += f'非{FIRMWARE_VERSION_LIST[1]}固件无法自动检测EEPROM大小\n'
+            else:
+                msg += f'EEPROM大小: {EEPROM_SIZE[eeprom_size]}'
+            log(msg)
+        else:
+            msg = f'串口连接成功！\n版本号: {version}\n'
+            log(msg)
+            firmware_version = 2
+            eeprom_size = 0
+        return SerialPortCheckResult(True, msg, firmware_version, eeprom_size, version)
+    except Exception as e:
+        msg = '串口连接失败！<-' + str(e)
+        log(msg)
+        return SerialPortCheckResult(False, msg, 2, 0, '')
+
+
+class RadioSession:
+    """在一次打开的串口上完成握手, 缓存固件版本和EEPROM大小, 供多个操作复用
+
+    eeprom_size 为 None 且 auto_detect 为 True 时自动检测EEPROM大小;
+    use_link_profile 为 True 时使用串口适配器保存的通信参数;
+    捕获时在握手后记录会话参数, 回放 (replay://) 时使用记录的参数, 不检测、不探测也不读写缓存和适配器配置,
+    与本机的缓存状态无关
+    """
+
+    def __init__(self, port: str, auto_detect: bool = False, eeprom_size: Optional[int] = None,
+                 retry_policy: Optional[serial_utils.RetryPolicy] = None, tracer: Optional[FrameTracer] = None,
+                 capture_path: Optional[str] = None, use_link_profile: bool = True):
+        self.port = port
+        self.auto_detect = auto_detect
+        self.retry_policy = retry_policy
+        self.tracer = tracer
+        self.capture_path = capture_path
+        self.use_link_profile = use_link_profile
+        self.link_profile: Optional[link_profile.LinkProfile] = None
+        self.serial_port = None
+        self.check = SerialPortCheckResult(False, '', 2, 0, '')
+        self._eeprom_size = eeprom_size
+
+    def __enter__(self) -> 'RadioSession':
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self) -> SerialPortCheckResult:
+        self.serial_port = serial_utils.open_serial_port(self.port)
+        if self.capture_path:
+            self.serial_port = wire_capture.CapturingPort(self.serial_port, self.capture_path)
+        if self.retry_policy is not None:
+            serial_utils.set_retry_policy(self.serial_port, self.retry_policy)
+        serial_utils.set_tracer(self.serial_port, self.tracer)
+        if self.replaying:
+            return self._open_replay()
+        self.check = check_serial_port(self.serial_port, self.auto_detect and self._eeprom_size is None)
+        if self.check.status:
+            chunk_probe.load_chunk_sizes(self.serial_port, self.version, self.firmware_version == 1)
+            if self.use_link_profile:
+                self.link_profile = link_profile.apply_saved_profile(self.port, self.serial_port)
+            if self.capture_path:
+                self.serial_port.record_session(self._session_info())
+        return self.check
+
+    @property
+    def replaying(self) -> bool:
+        return isinstance(self.serial_port, wire_capture.ReplayPort)
+
+    def _session_info(self) -> dict:
+        return {
+            'eeprom_size': self.eeprom_size,
+            'timeout': self.serial_port.timeout,
+            'chunk_sizes': dataclasses.asdict(serial_utils.chunk_sizes(self.serial_port)),
+            'windows': dataclasses.asdict(serial_utils.pipeline_windows(self.serial_port)),
+        }
+
+    def _open_replay(self) -> SerialPortCheckResult:
+        info = self.serial_port.session
+        if info is None:
+            msg = '串口连接失败！<-捕获文件中没有会话参数, 无法回放'
+            log(msg)
+            self.check = SerialPortCheckResult(False, msg, 2, 0, '')
+            return self.check
+        if self._eeprom_size is None:
+            self._eeprom_size = info['eeprom_size']
+        self.check = check_serial_port(self.serial_port, False)
+        if self.check.status:
+            self.serial_port.skip_to_session()
+            self.serial_port.timeout = info['timeout']
+            for target, values in ((serial_utils.chunk_sizes(self.serial_port), info['chunk_sizes']),
+                                   (serial_utils.pipeline_windows(self.serial_port), info['windows'])):
+                for key, value in values.items():
+                    setattr(target, key, value)
+        return self.check
+
+    def close(self):
+        if self.serial_port is not None:
+            if self.check.status and not self.replaying:
+                chunk_probe.save_chunk_sizes(self.serial_port, self.version)
+            log(self.stats.summary())
+            self.serial_port.close()
+            self.serial_port = None
+
+    @property
+    def version(self) -> str:
+        return self.check.raw_version_text
+
+    @property
+    def firmware_version(self) -> int:
+        return firmware_version_of(self.version)
+
+    @property
+    def eeprom_size(self) -> int:
+        if self._eeprom_size is not None:
+            return self._eeprom_size
+        return self.check.eeprom_size
+
+    @property
+    def stats(self) -> serial_utils.LinkStats:
+        return serial_utils.link_stats(self.serial_port)
+
+    def reset_radio(self):
+        serial_utils.reset_radio(self.serial_port)
+
+
+def eeprom_image_size(eeprom_size: int) -> int:
+    if eeprom_size > 0:
+        return 0x20000 * eeprom_size
+    return 0x2000
+
+
+def require_extended(firmware_version: int, eeprom_size: int, min_eeprom_size: int, target: str):
+    if firmware_version != 1:
+        raise Exception(f'非{FIRMWARE_VERSION_LIST[1]}固件，无法写入{target}！')
+    if eeprom_size < min_eeprom_size:
+        raise Exception(f'EEPROM小于{EEPROM_SIZE[min_eeprom_size].split()[0]}，无法写入{target}！')
+
+
+def auto_font_plan(version: str) -> Optional[AutoFontPlan]:
+    if not version.startswith('LOSEHU'):
+        return None
+    version_number = int(version[6:9])
+    version_code = version[-1]
+    if version_code == 'H':
+        if version_number == 118:
+            font_type = FontType.GB2312_UNCOMPRESSED
+        else:
+            font_type = FontType.GB2312_COMPRESSED
+    elif version_code == 'K':
+        if version_number < 118:
+            font_type = FontType.LOSEHU_FONT
+        else:
+            font_type = FontType.GB2312_COMPRESSED
+    else:
+        return None
+
+    if version_number < 118:
+        return AutoFontPlan(version_number, version_code, font_type, False, None, 1)
+    pinyin_new = None
+    if version_code == 'H' and version_number >= 123:
+        pinyin_new = version_number > 123
+    return AutoFontPlan(version_number, version_code, font_type, True, pinyin_new, 4 if version_code == 'H' else 3)
+
+
+def font_data(font_type: FontType):
+    """返回 (起始地址, 字库数据)"""
+    if font_type == FontType.GB2312_COMPRESSED:
+        return 0x2E00, font.GB2312_COMPRESSED
+    elif font_type == FontType.GB2312_UNCOMPRESSED:
+        return 0x2E00, font.GB2312_UNCOMPRESSED
+    elif font_type == FontType.LOSEHU_FONT:
+        return 0x2000, font.LOSEHU_FONT
+    raise Exception('未知字库类型！')
+
+
+def tone_options_data() -> bytes:
+    return struct.pack(f'<{len(tone.CTCSS_OPTIONS) + len(tone.DCS_OPTIONS)}H',
+                       *(tone.CTCSS_OPTIONS + tone.DCS_OPTIONS))
+
+
+def read_pages(serial_port: Serial, start_addr: int, end_addr: int, on_progress: ProgressCallback = _no_progress,
+               extended: bool = False, step: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """逐页读取并汇报进度, 生成 (相对 start_addr 的偏移, 数据); step 为空时使用串口的读取块大小"""
+    step = step or serial_utils.chunk_sizes(serial_port).read_size()
+    total_page = (end_addr - start_addr + step - 1) // step
+    current_step = 0
+    for addr, page in serial_utils.read_eeprom_pipelined(serial_port, start_addr, end_addr, step, extended):
+        yield addr - start_addr, page
+        current_step += 1
+        on_progress((current_step / total_page) * 100, addr + len(page))
+
+
+def read_data(serial_port: Serial, start_addr: int, end_addr: int, on_progress: ProgressCallback = _no_progress,
+              extended: bool = False, step: Optional[int] = None) -> bytes:
+    data = bytearray(end_addr - start_addr)
+    for offset, page in read_pages(serial_port, start_addr, end_addr, on_progress, extended, step):
+        data[offset:offset + len(page)] = page
+    return bytes(data)
+
+
+def read_to_file(serial_port: Serial, start_addr: int, end_addr: int, path: str,
+                 on_progress: ProgressCallback = _no_progress, extended: bool = False, step: Optional[int] = None):
+    """边读取边写入文件, 内存占用与读取大小无关; 全部读取成功后才替换目标文件"""
+    with file_utils.AtomicFileWriter(path, end_addr - start_addr) as writer:
+        for offset, page in read_pages(serial_port, start_addr, end_addr, on_progress, extended, step):
+            writer.write_at(offset, page)
+
+
+def find_changed_pages(serial_port: Serial, start_addr: int, data: bytes,
+                       on_progress: ProgressCallback = _no_progress, step: Optional[int] = None) -> List[int]:
+    log('正在读取目标区域以比较差异')
+    step = step or serial_utils.chunk_sizes(serial_port).read_size()
+    data_len = len(data)
+    total_page = (data_len + step - 1) // step
+    extended = start_addr + data_len >= 0x10000
+    changed = []
+    current_step = 0
+    for addr, page in serial_utils.read_eeprom_pipelined(serial_port, start_addr, start_addr + data_len, step,
+                                                         extended):
+        offset = addr - start_addr
+        if page != data[offset:offset + step]:
+            changed.append(offset)
+        current_step += 1
+        on_progress((current_step / total_page) * 100, addr)
+    log(f'共{total_page}页, 其中{total_page - len(changed)}页内容相同将被跳过')
+    return changed
+
+
+def verify_resume_offset(serial_port: Serial, start_addr: int, data: bytes, resume_offset: int,
+                         verify_pages: int = 2, step: Optional[int] = None) -> int:
+    """读回断点前的几页, 返回第一个与数据不一致的页的偏移, 全部一致时返回 resume_offset"""
+    step = step or serial_utils.chunk_sizes(serial_port).read_size()
+    verify_start = max(resume_offset - verify_pages * step, 0)
+    if verify_start >= resume_offset:
+        return resume_offset
+    log(f'正在校验断点前已写入的数据: {hex(start_addr + verify_start)} - {hex(start_addr + resume_offset)}')
+    extended = start_addr + len(data) >= 0x10000
+    for offset, page in read_pages(serial_port, start_addr + verify_start, start_addr + resume_offset,
+                                   extended=extended, step=step):
+        offset += verify_start
+        if page != data[offset:offset + len(page)]:
+            log(f'断点前数据不一致, 从 {hex(start_addr + offset)} 重新写入')
+            return offset
+    return resume_offset
+
+
+def iter_pages(data: PageSource, step: int = 128, start_offset: int = 0) -> Iterator[Tuple[int, memoryview]]:
+    """按偏移逐页生成 (偏移, 页), 页是原数据的 memoryview 切片, 不复制数据
+
+    data 为 bytes / bytearray / memoryview / mmap 时按 step 切分; 为页的迭代器时按原样生成,
+    跳过 start_offset 之前的页
+    """
+    if isinstance(data, BUFFER_TYPES):
+        view = memoryview(data)
+        for offset in range(start_offset, len(view), step):
+            yield offset, view[offset:offset + step]
+        return
+    offset = 0
+    for page in data:
+        if offset >= start_offset:
+            yield offset, memoryview(page)
+        offset += len(page)
+
+
+def write_data(serial_port: Serial, start_addr: int, data: Union[PageSource, List[int]],
+               on_progress: ProgressCallback = _no_progress, step: Optional[int] = None, skip_unchanged: bool = False,
+               journal: Optional[TransferJournal] = None, verify_pages: int = 2, verify: bool = False,
+               cached_frames: bool = False, data_len: Optional[int] = None):
+    """写入数据; 传入 journal 时记录每个被确认的页, 并从上次中断的位置继续写入
+
+    data 可以是 bytes / memoryview / mmap, 也可以是页的迭代器, 此时需要通过 data_len 给出总长度,
+    并且不支持 skip_unchanged / journal / verify / cached_frames;
+    step 为空时使用串口的写入块大小, 未知时用数据开头探测;
+    verify 为 True 时写入后读回校验, 重新写入不一致的页, 仍然不一致时抛出异常;
+    cached_frames 为 True 时从 frame_cache 取得预先编码好的写入帧, 写入时不再逐页编码
+    """
+    if isinstance(data, list) and data and isinstance(data[0], int):
+        data = bytes(data)
+    if not isinstance(data, BUFFER_TYPES):
+        if data_len is None:
+            raise Exception('按页写入时需要指定数据总长度！')
+        if skip_unchanged or journal is not None or verify or cached_frames:
+            raise Exception('按页写入时不支持跳过未修改的页、断点续写和写入校验！')
+    else:
+        data_len = len(data)
+    extended = frame_cache.is_extended(start_addr, data_len)
+    resume_offset = 0
+    if journal is not None:
+        resume_offset = journal.begin(start_addr, data)
+    if step is None:
+        step = _write_step(serial_port, start_addr, data, resume_offset, extended) \
+            if isinstance(data, BUFFER_TYPES) else serial_utils.DEFAULT_CHUNK_SIZE
+    frames = frame_cache.load_frames(start_addr, data, step) if cached_frames else None
+    if resume_offset > 0:
+        # 从块边界继续, 预编码的帧按块对齐
+        resume_offset -= resume_offset % step
+        if verify_pages > 0:
+            resume_offset = verify_resume_offset(serial_port, start_addr, data, resume_offset, verify_pages, step)
+        log(f'从 {hex(start_addr + resume_offset)} 继续写入, 跳过已写入的 {resume_offset} 字节')
+    pages = iter_pages(data, step, resume_offset)
+    total_bytes = data_len - resume_offset
+    if skip_unchanged:
+        changed = find_changed_pages(serial_port, start_addr + resume_offset, memoryview(data)[resume_offset:],
+                                     on_progress, step)
+        pages = ((resume_offset + offset, memoryview(data)[resume_offset + offset:resume_offset + offset + step])
+                 for offset in changed)
+        total_bytes = sum(min(step, data_len - resume_offset - offset) for offset in changed)
+    # 已发送但还没有确认的页 (偏移, 长度), 确认按发送顺序返回
+    in_flight = deque()
+
+    def page_frames():
+        for offset, page in pages:
+            in_flight.append((offset, len(page)))
+            addr = start_addr + offset
+            if frames is not None:
+                yield addr, frames.frame(offset)
+            else:
+                yield addr, frame_cache.encode_write_frame(addr, page, extended, serial_port)
+
+    # 按已确认的字节计算进度, 最后不满一页的部分按实际长度计入
+    written_bytes = 0
+    on_progress(0, start_addr + resume_offset)
+    try:
+        for addr in serial_utils.write_eeprom_pipelined(serial_port, page_frames(), extended):
+            offset, length = in_flight.popleft()
+            written_bytes += length
+            if journal is not None:
+                journal.record(offset, length)
+            on_progress((written_bytes / total_bytes) * 100, addr + length)
+    except BaseException:
+        if journal is not None:
+            journal.interrupted()
+        raise
+    if journal is not None:
+        journal.finish()
+    if verify:
+        result = verify_data(serial_port, start_addr, data, on_progress, step, rewrite=True)
+        if not result.ok:
+            raise Exception(f'写入校验失败, 共{len(result.mismatched)}页数据与写入的内容不一致！')
+
+
+def _write_step(serial_port: Serial, start_addr: int, data: Union[bytes, memoryview, mmap.mmap], resume_offset: int,
+                extended: bool) -> int:
+    """返回串口的写入块大小, 未知时用 resume_offset 处即将写入的数据探测并记录
+
+    缓存的写入长度只是最先尝试的长度, 同样要写入并读回确认
+    """
+    sizes = serial_utils.chunk_sizes(serial_port)
+    step = sizes.write_size(extended)
+    if step == 0:
+        addr = start_addr + resume_offset
+        if addr % chunk_probe.CHUNK_ALIGNMENT:
+            return serial_utils.DEFAULT_CHUNK_SIZE
+        step = chunk_probe.probe_write_size(serial_port, addr, memoryview(data)[resume_offset:], extended, sizes.read,
+                                            sizes.write_hint_size(extended))
+        if step == 0:
+            # 数据太短无法探测, 本次使用默认长度
+            return serial_utils.DEFAULT_CHUNK_SIZE
+        sizes.set_write_size(extended, step)
+    return chunk_probe.aligned_step(start_addr, step)
+
+
+def _write_page(serial_port: Serial, addr: int, page: Union[bytes, memoryview], extended: bool):
+    if not extended:
+        serial_utils.write_eeprom(serial_port, addr, page)
+    else:
+        serial_utils.write_extra_eeprom(serial_port, addr, page)
+
+
+def verify_data(serial_port: Serial, start_addr: int, data: Union[bytes, memoryview, mmap.mmap, List[int]],
+                on_progress: ProgressCallback = _no_progress, step: Optional[int] = None,
+                rewrite: bool = False) -> VerifyResult:
+    """读回写入的区域并逐页与数据比较, 同时计算读回数据的SHA-256, 不保存读回的数据
+
+    rewrite 为 True 时重新写入不一致的页并再次读回确认
+    """
+    step = step or serial_utils.chunk_sizes(serial_port).read_size()
+    log(f'正在校验 {hex(start_addr)} - {hex(start_addr + len(data))}')
+    view = memoryview(data if isinstance(data, BUFFER_TYPES) else bytes(data))
+    extended = start_addr + len(data) >= 0x10000
+    expected_hash = hashlib.sha256(view)
+    read_hash = hashlib.sha256()
+    mismatched = []
+    for offset, page in read_pages(serial_port, start_addr, start_addr + len(view), on_progress, extended, step):
+        read_hash.update(page)
+        if page != view[offset:offset + len(page)]:
+            mismatched.append(offset)
+    result = VerifyResult((len(view) + step - 1) // step, mismatched, expected_hash.hexdigest(),
+                          read_hash.hexdigest())
+    if mismatched:
+        log(f'校验发现{len(mismatched)}页不一致: ' + ', '.join(hex(start_addr + offset) for offset in mismatched[:16])
+            + (' ...' if len(mismatched) > 16 else ''))
+    if mismatched and rewrite:
+        # 读取块可能大于固件支持的写入长度, 按已确认的写入块大小和 write_data 相同的块边界重新写入
+        write_step = serial_utils.chunk_sizes(serial_port).write_size(extended) or serial_utils.DEFAULT_CHUNK_SIZE
+        write_step = chunk_probe.aligned_step(start_addr, write_step)
+        still_mismatched = []
+        for offset in mismatched:
+            addr = start_addr + offset
+            page = bytes(view[offset:offset + step])
+            chunk_start = offset
+            while chunk_start < offset + len(page):
+                chunk_end = min(chunk_start - chunk_start % write_step + write_step, offset + len(page))
+                _write_page(serial_port, start_addr + chunk_start, view[chunk_start:chunk_end], extended)
+                chunk_start = chunk_end
+            read_back = next(read_pages(serial_port, addr, addr + len(page), extended=extended, step=step))[1]
+            if read_back != page:
+                still_mismatched.append(offset)
+        log(f'已重新写入{len(mismatched)}页, 其中{len(still_mismatched)}页仍然不一致')
+        result.rewritten = len(mismatched)
+        result.mismatched = still_mismatched
+    if result.ok:
+        log('校验通过')
+    return result
+
+
+def backup_eeprom(serial_port: Serial, eeprom_size: int, on_progress: ProgressCallback = _no_progress) -> bytes:
+    target_eeprom_offset = eeprom_image_size(eeprom_size)
+    return read_data(serial_port, 0x0, target_eeprom_offset, on_progress, target_eeprom_offset >= 0x10000)
+
+
+def backup_eeprom_to_file(serial_port: Serial, eeprom_size: int, path: str,
+                          on_progress: ProgressCallback = _no_progress):
+    target_eeprom_offset = eeprom_image_size(eeprom_size)
+    read_to_file(serial_port, 0x0, target_eeprom_offset, path, on_progress, target_eeprom_offset >= 0x10000)
+
+
+def restore_eeprom(serial_port: Serial, data: bytes, on_progress: ProgressCallback = _no_progress,
+                   skip_unchanged: bool = False, journal: Optional[TransferJournal] = None, verify: bool = False):
+    write_data(serial_port, 0x0, data, on_progress, skip_unchanged=skip_unchanged, journal=journal, verify=verify)
+
+
+def find_unerased_pages(serial_port: Serial, start_addr: int, end_addr: int,
+                        on_progress: ProgressCallback = _no_progress, step: Optional[int] = None) -> List[int]:
+    """读取区域, 返回内容不全是 0xFF 的页的偏移"""
+    step = step or serial_utils.chunk_sizes(serial_port).read_size()
+    log('正在读取EEPROM以查找需要清空的页')
+    erased = b'\xff' * step
+    total_page = (end_addr - start_addr + step - 1) // step
+    unerased = [offset for offset, page in
+                read_pages(serial_port, start_addr, end_addr, on_progress, end_addr >= 0x10000, step)
+                if page != erased[:len(page)]]
+    log(f'共{total_page}页, 其中{total_page - len(unerased)}页已是空白将被跳过')
+    return unerased
+
+
+def erased_pages(start_addr: int, end_addr: int, offsets: Optional[Iterable[int]] = None,
+                 step: int = 128) -> Iterator[Tuple[int, bytes]]:
+    """逐页生成 (地址, 全 0xFF 的页), 不分配整个区域大小的缓冲区; offsets 为空时生成所有页"""
+    erased = b'\xff' * step
+    if offsets is None:
+        offsets = range(0, end_addr - start_addr, step)
+    for offset in offsets:
+        addr = start_addr + offset
+        yield addr, erased[:min(step, end_addr - addr)]
+
+
+def clean_eeprom(serial_port: Serial, eeprom_size: int, firmware_version: int,
+                 on_progress: ProgressCallback = _no_progress, sparse: bool = True, step: Optional[int] = None):
+    """清空EEPROM; sparse 为 True 时先读取, 只写入不是空白的页"""
+    if firmware_version != 1:
+        # 非扩容固件仅清除前8KiB原厂大小数据
+        eeprom_size = 0
+    end_addr = eeprom_image_size(eeprom_size)
+    extended = end_addr >= 0x10000
+    if step is None:
+        # 全是 0xFF 的数据无法发现跨页写入的错误, 不用来探测写入块大小
+        step = serial_utils.chunk_sizes(serial_port).write_size(extended) or serial_utils.DEFAULT_CHUNK_SIZE
+    if sparse:
+        offsets = find_unerased_pages(serial_port, 0, end_addr, on_progress, step)
+    else:
+        offsets = range(0, end_addr, step)
+    total_page = len(offsets)
+    page_frames = ((addr, frame_cache.encode_write_frame(addr, page, extended, serial_port))
+                   for addr, page in erased_pages(0, end_addr, offsets, step))
+    for current_step, addr in enumerate(serial_utils.write_eeprom_pipelined(serial_port, page_frames, extended)):
+        on_progress(((current_step + 1) / total_page) * 100, addr)
+
+
+def read_calibration(serial_port: Serial, on_progress: ProgressCallback = _no_progress) -> bytes:
+    return read_data(serial_port, 0x1E00, 0x2000, on_progress)
+
+
+def read_calibration_to_file(serial_port: Serial, path: str, on_progress: ProgressCallback = _no_progress):
+    read_to_file(serial_port, 0x1E00, 0x2000, path, on_progress)
+
+
+def write_calibration(serial_port: Serial, data: bytes, on_progress: ProgressCallback = _no_progress,
+                      verify: bool = False):
+    if len(data) != 512:
+        raise Exception('校准参数文件大小错误')
+    write_data(serial_port, 0x1E00, data, on_progress, verify=verify)
+
+
+def read_config(serial_port: Serial, on_progress: ProgressCallback = _no_progress) -> bytes:
+    return read_data(serial_port, 0x0000, 0x1D00, on_progress)
+
+
+def read_config_to_file(serial_port: Serial, path: str, on_progress: ProgressCallback = _no_progress):
+    read_to_file(serial_port, 0x0000, 0x1D00, path, on_progress)
+
+
+def write_config(serial_port: Serial, data: bytes, on_progress: ProgressCallback = _no_progress,
+                 verify: bool = False):
+    if len(data) != 0x1d00:
+        raise Exception('配置参数文件大小错误')
+    write_data(serial_port, 0x0, data, on_progress, verify=verify)
+
+
+def write_font(serial_port: Serial, font_type: FontType, on_progress: ProgressCallback = _no_progress,
+               skip_unchanged: bool = False, journal: Optional[TransferJournal] = None, verify: bool = False):
+    addr, data = font_data(font_type)
+    write_data(serial_port, addr, data, on_progress, skip_unchanged=skip_unchanged, journal=journal, verify=verify,
+               cached_frames=True)
+
+
+def write_font_conf(serial_port: Serial, on_progress: ProgressCallback = _no_progress, verify: bool = False):
+    write_data(serial_port, 0x2480, font.FONT_CONF, on_progress, verify=verify, cached_frames=True)
+
+
+def write_tone_options(serial_port: Serial, on_progress: ProgressCallback = _no_progress, verify: bool = False):
+    write_data(serial_port, 0x2C00, tone_options_data(), on_progress, verify=verify, cached_frames=True)
+
+
+def pinyin_index_data(new: bool = False):
+    """返回 (起始地址, 拼音检索表数据)"""
+    return 0x20000, font.PINYIN_NEW if new else font.PINYIN_OLD
+
+
+def write_pinyin_index(serial_port: Serial, new: bool = False, on_progress: ProgressCallback = _no_progress,
+                       skip_unchanged: bool = False, journal: Optional[TransferJournal] = None, verify: bool = False):
+    addr, pinyin_data = pinyin_index_data(new)
+    write_data(serial_port, addr, pinyin_data, on_progress, skip_unchanged=skip_unchanged, journal=journal,
+               verify=verify, cached_frames=True)
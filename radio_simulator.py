@@ -0,0 +1,302 @@
+import os
+import random
+import struct
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+import frame_codec
+
+EEPROM_SIZES = {
+    '8K': 0x2000,
+    '128K': 0x20000,
+    '256K': 0x40000,
+    '384K': 0x60000,
+    '512K': 0x80000,
+}
+
+# 地址 URL 相同的模拟电台共用同一个实例, 多次打开串口时EEPROM内容保持不变
+_url_radios = {}
+_url_lock = threading.Lock()
+
+
+class SimulatedRadio:
+    """模拟K5电台的串口协议, 可以直接代替 serial.Serial 使用
+
+    每个字节按 10/baudrate 秒计算线路时间, 每个回复额外增加 latency 秒的响应延迟,
+    baudrate 为 0 时不模拟线路时间; error_rate 为每个回复被丢弃或损坏的概率, 用于模拟线路干扰;
+    max_chunk 为固件接受的最大读写长度, 更长的请求不回复; page_size 不为 0 时写入不拆分跨页的部分,
+    超出页的数据回绕到页开头, 与直接写入EEPROM芯片的行为一致
+    """
+
+    def __init__(self, eeprom_size: int = 0x40000, firmware: str = 'LOSEHU124H', baudrate: int = 38400,
+                 latency: float = 0.0, timeout: Optional[float] = 2, image: Optional[bytes] = None,
+                 error_rate: float = 0.0, seed: Optional[int] = None, max_chunk: int = 0xFF, page_size: int = 0):
+        if eeprom_size not in EEPROM_SIZES.values():
+            raise Exception(f'不支持的EEPROM大小: {eeprom_size}')
+        self.eeprom = bytearray(b'\xff' * eeprom_size)
+        if image is not None:
+            self.eeprom[:len(image)] = image[:eeprom_size]
+        self.firmware = firmware
+        self.extended = firmware.startswith('LOSEHU') and firmware[-1] in ('K', 'H')
+        self.baudrate = baudrate
+        self.latency = latency
+        self.timeout = timeout
+        self.error_rate = error_rate
+        self.max_chunk = max_chunk
+        self.page_size = page_size
+        self._random = random.Random(seed)
+        self.is_open = True
+        self.reset_count = 0
+        self.frames_received = 0
+        self.frames_sent = 0
+        self.frames_corrupted = 0
+        self._host_buffer = bytearray()
+        self._tx_busy_until = 0.0
+        self._rx_busy_until = 0.0
+        # (可读取时间, 数据) 按时间顺序排列
+        self._replies = []
+        self._rx_buffer = bytearray()
+        self._lock = threading.Lock()
+
+    # --- serial.Serial 接口 ---
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data) -> int:
+        with self._lock:
+            now = time.perf_counter()
+            self._tx_busy_until = max(now, self._tx_busy_until) + self._wire_time(len(data))
+            self._host_buffer += data
+            self._process_host_buffer(self._tx_busy_until)
+        return len(data)
+
+    def flush(self):
+        delay = self._tx_busy_until - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while True:
+            with self._lock:
+                now = time.perf_counter()
+                self._collect_ready(now)
+                if len(self._rx_buffer) >= size:
+                    break
+                next_ready = self._replies[0][0] if self._replies else None
+            if deadline is not None and (next_ready is None or next_ready > deadline):
+                remaining = deadline - now
+                if remaining > 0:
+                    time.sleep(remaining)
+                with self._lock:
+                    self._collect_ready(time.perf_counter())
+                break
+            if next_ready is None:
+                time.sleep(0.001)
+            else:
+                time.sleep(max(next_ready - now, 0))
+        with self._lock:
+            data = bytes(self._rx_buffer[:size])
+            del self._rx_buffer[:size]
+        return data
+
+    @property
+    def in_waiting(self) -> int:
+        with self._lock:
+            self._collect_ready(time.perf_counter())
+            return len(self._rx_buffer)
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._collect_ready(time.perf_counter())
+            self._rx_buffer.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    # --- 协议实现 ---
+
+    def _wire_time(self, length: int) -> float:
+        if not self.baudrate:
+            return 0.0
+        return length * 10 / self.baudrate
+
+    def _collect_ready(self, now: float):
+        while self._replies and self._replies[0][0] <= now:
+            self._rx_buffer += self._replies.pop(0)[1]
+
+    def _process_host_buffer(self, received_at: float):
+        buf = self._host_buffer
+        while True:
+            start = buf.find(b'\xab\xcd')
+            if start < 0:
+                # 保留可能是帧头前半部分的最后一个字节
+                del buf[:max(len(buf) - 1, 0)]
+                return
+            del buf[:start]
+            if len(buf) < 4:
+                return
+            frame_len = buf[2] + frame_codec.FRAME_OVERHEAD
+            if len(buf) < frame_len:
+                return
+            frame = bytes(buf[:frame_len])
+            try:
+                payload, received_crc, crc = frame_codec.decode_frame(frame)
+            except Exception:
+                # 不是有效的帧, 跳过当前帧头继续寻找
+                del buf[:2]
+                continue
+            del buf[:frame_len]
+            if received_crc != crc:
+                continue
+            self.frames_received += 1
+            reply = self._handle_command(payload)
+            if reply is not None:
+                self._queue_reply(reply, received_at)
+
+    def _queue_reply(self, payload: bytes, received_at: float):
+        # 与固件一致, 回复不计算CRC而是填充 0xFFFF
+        length = len(payload)
+        frame = bytearray(length + frame_codec.FRAME_OVERHEAD)
+        struct.pack_into('>HBB', frame, 0, frame_codec.FRAME_HEADER, length, 0)
+        frame[4:4 + length + 2] = frame_codec.xor_obfuscate(payload + b'\xff\xff')
+        struct.pack_into('>H', frame, length + 6, frame_codec.FRAME_FOOTER)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.frames_corrupted += 1
+            if self._random.random() < 0.5:
+                # 丢失回复的后半部分
+                del frame[self._random.randrange(1, len(frame)):]
+            else:
+                frame[self._random.randrange(len(frame))] ^= 0xff
+        start = max(received_at + self.latency, self._rx_busy_until)
+        self._rx_busy_until = start + self._wire_time(len(frame))
+        self._replies.append((self._rx_busy_until, bytes(frame)))
+        self.frames_sent += 1
+
+    def _eeprom_read(self, addr: int, length: int) -> bytes:
+        # 超出容量的地址回绕到芯片开头, 与真实EEPROM的地址线行为一致
+        size = len(self.eeprom)
+        return bytes(self.eeprom[(addr + i) % size] for i in range(length)) \
+            if addr + length > size else bytes(self.eeprom[addr:addr + length])
+
+    def _eeprom_write(self, addr: int, data: bytes):
+        if self.page_size:
+            page_start = addr - addr % self.page_size
+            for i, byte in enumerate(data):
+                self.eeprom[page_start + (addr - page_start + i) % self.page_size] = byte
+            return
+        size = len(self.eeprom)
+        if addr + len(data) > size:
+            for i, byte in enumerate(data):
+                self.eeprom[(addr + i) % size] = byte
+        else:
+            self.eeprom[addr:addr + len(data)] = data
+
+    def _handle_command(self, payload: bytes) -> Optional[bytes]:
+        if len(payload) < 4:
+            return None
+        cmd = payload[0] | (payload[1] << 8)
+        if cmd in (0x051B, 0x052B, 0x051D, 0x0538) and payload[6] > self.max_chunk + (2 if cmd == 0x0538 else 0):
+            return None
+        if cmd == 0x0514:
+            # 与固件的 REPLY_0514_t 一致: 版本号16字节, 是否有自定义AES密钥, 是否锁屏, 2字节填充, 16字节挑战值
+            version = self.firmware.encode('ascii')[:15].ljust(16, b'\x00')
+            body = version + b'\x00\x00\x00\x00' + b'\x00' * 16
+            return struct.pack('<HH', 0x0515, len(body)) + body
+        if cmd == 0x051B:
+            offset, length = struct.unpack_from('<HB', payload, 4)
+            data = self._eeprom_read(offset, length)
+            return struct.pack('<HHHBB', 0x051C, length + 4, offset, length, 0) + data
+        if cmd == 0x052B and self.extended:
+            offset, length = struct.unpack_from('<HB', payload, 4)
+            extra, = struct.unpack_from('<H', payload, 12)
+            data = self._eeprom_read((offset << 16) | extra, length)
+            return struct.pack('<HHHBB', 0x051C, length + 4, offset, length, 0) + data
+        # 写入确认与固件的 REPLY_051D_t 一致, 负载只有指令头和偏移
+        if cmd == 0x051D:
+            offset, length = struct.unpack_from('<HB', payload, 4)
+            self._eeprom_write(offset, payload[12:12 + length])
+            return struct.pack('<HHH', 0x051E, 2, offset)
+        if cmd == 0x0538 and self.extended:
+            offset, length = struct.unpack_from('<HB', payload, 4)
+            extra, = struct.unpack_from('<H', payload, 12)
+            self._eeprom_write((offset << 16) | extra, payload[14:14 + length - 2])
+            return struct.pack('<HHH', 0x051E, 2, offset)
+        if cmd == 0x05DD:
+            self.reset_count += 1
+            return None
+        return None
+
+    # --- pty ---
+
+    def serve_pty(self) -> str:
+        """在伪终端上提供模拟电台, 返回可以用 serial.Serial 打开的设备路径 (仅POSIX)"""
+        import select
+        import tty
+
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+
+        def serve():
+            while self.is_open:
+                with self._lock:
+                    self._collect_ready(time.perf_counter())
+                    ready = bytes(self._rx_buffer)
+                    self._rx_buffer.clear()
+                    next_ready = self._replies[0][0] if self._replies else None
+                if ready:
+                    os.write(master, ready)
+                wait = 0.05 if next_ready is None else max(min(next_ready - time.perf_counter(), 0.05), 0)
+                readable, _, _ = select.select([master], [], [], wait)
+                if readable:
+                    try:
+                        data = os.read(master, 4096)
+                    except OSError:
+                        break
+                    self.write(data)
+            os.close(master)
+
+        threading.Thread(target=serve, daemon=True).start()
+        return os.ttyname(slave)
+
+
+def parse_size(text: str) -> int:
+    text = text.upper().rstrip('IB')
+    if text in EEPROM_SIZES:
+        return EEPROM_SIZES[text]
+    return int(text, 0)
+
+
+def from_url(url: str, timeout: Optional[float] = 2) -> SimulatedRadio:
+    """根据 sim://<固件版本>?size=256K&baud=38400&latency=0.005&errors=0.01&chunk=128&page=128 返回模拟电台"""
+    with _url_lock:
+        radio = _url_radios.get(url)
+        if radio is None:
+            parsed = urlparse(url)
+            params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+            radio = SimulatedRadio(
+                eeprom_size=parse_size(params.get('size', '256K')),
+                firmware=parsed.netloc or 'LOSEHU124H',
+                baudrate=int(params.get('baud', 38400)),
+                latency=float(params.get('latency', 0)),
+                error_rate=float(params.get('errors', 0)),
+                max_chunk=int(params.get('chunk', 0xFF)),
+                page_size=int(params.get('page', 0)),
+            )
+            _url_radios[url] = radio
+    radio.timeout = timeout
+    radio.open()
+    return radio
@@ -1,65 +1,274 @@
+import dataclasses
+import itertools
 import struct
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
 import serial
+
+import frame_codec
+import wire_capture
+from frame_trace import FrameTracer
 from logger import log
 
+DEFAULT_READ_WINDOW = 4
+# 固件忙于写入EEPROM时可能丢弃连续到达的帧, 默认逐包写入; 可以用 profile-link 按串口适配器测量更大的窗口
+DEFAULT_WRITE_WINDOW = 1
+# 扩容读取的回复只回显地址高16位, 流水线中相邻请求的长度依次减少此值, 用回显的长度区分回复
+EXTENDED_READ_LENGTH_STEP = 4
+SIMULATOR_URL_PREFIX = 'sim://'
+# 固件回复中代替CRC的填充值
+REPLY_CRC_PADDING = 0xFFFF
+# 写入确认 (0x051E) 的整帧长度: 固件的 REPLY_051D_t 为4字节指令头和2字节偏移;
+# 预计长度超过实际的帧时读取会一直等到超时
+WRITE_REPLY_SIZE = 6 + frame_codec.FRAME_OVERHEAD
+# 每帧读写的默认数据长度, 所有固件都支持
+DEFAULT_CHUNK_SIZE = 128
+# 一帧能容纳的最大数据长度: 读取回复头8字节, 扩容写入指令头14字节
+MAX_READ_CHUNK = frame_codec.MAX_PAYLOAD_LENGTH - 8
+MAX_WRITE_CHUNK = frame_codec.MAX_PAYLOAD_LENGTH - 14
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    # 单个帧失败后最多重发的次数
+    max_retries: int = 3
+    # 第一次重发前等待的时间, 之后每次翻倍, 不超过 max_backoff
+    backoff: float = 0.02
+    max_backoff: float = 0.5
+
+    def delay(self, attempt: int) -> float:
+        return min(self.backoff * (2 ** attempt), self.max_backoff)
+
+
+@dataclasses.dataclass
+class LinkStats:
+    frames_sent: int = 0
+    frames_received: int = 0
+    # 重发的帧数
+    retries: int = 0
+    # 回复CRC与内容不符的次数
+    crc_failures: int = 0
+    # 为了找到帧头而丢弃数据的次数和丢弃的字节数
+    resyncs: int = 0
+    bytes_discarded: int = 0
+    # 等待回复超时的次数
+    timeouts: int = 0
+
+    def as_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+    def summary(self) -> str:
+        return (f'通信统计: 发送 {self.frames_sent} 帧, 接收 {self.frames_received} 帧, 重试 {self.retries} 次, '
+                f'CRC错误 {self.crc_failures} 次, 重新同步 {self.resyncs} 次 (丢弃 {self.bytes_discarded} 字节), '
+                f'超时 {self.timeouts} 次')
+
+
+@dataclasses.dataclass
+class ChunkSizes:
+    """每帧读写的数据长度; 写入为 0 表示未知, 在下一次写入时探测"""
+    read: int = DEFAULT_CHUNK_SIZE
+    write: int = DEFAULT_CHUNK_SIZE
+    write_extended: int = DEFAULT_CHUNK_SIZE
+    # 串口适配器配置限制的读取长度, 0 表示不限制; 只对当前串口有效, 不保存到块大小缓存
+    read_limit: int = 0
+    # 块大小缓存中的写入长度; 写入长度取决于电台的EEPROM, 探测时最先尝试, 读回确认后才使用
+    write_hint: int = 0
+    write_extended_hint: int = 0
+
+    def read_size(self) -> int:
+        return min(self.read, self.read_limit) if self.read_limit else self.read
+
+    def write_size(self, extended: bool) -> int:
+        return self.write_extended if extended else self.write
+
+    def write_hint_size(self, extended: bool) -> int:
+        return self.write_extended_hint if extended else self.write_hint
+
+    def set_write_size(self, extended: bool, size: int):
+        if extended:
+            self.write_extended = size
+        else:
+            self.write = size
+
+
+@dataclasses.dataclass
+class PipelineWindows:
+    """流水线读写时在途的帧数"""
+    read: int = DEFAULT_READ_WINDOW
+    write: int = DEFAULT_WRITE_WINDOW
+
+
+class _Link:
+    def __init__(self):
+        self.policy = RetryPolicy()
+        self.stats = LinkStats()
+        self.chunks = ChunkSizes()
+        self.windows = PipelineWindows()
+        # 为空时不记录每帧的耗时
+        self.tracer: Optional[FrameTracer] = None
+        # 已从串口读取但还没有解析的数据
+        self.rx_buffer = bytearray()
+
+
+# 每个打开的串口对应的重试策略和统计, 串口对象释放后自动移除
+_links = weakref.WeakKeyDictionary()
+_links_lock = threading.Lock()
+
+
+def _link(serial_port) -> _Link:
+    with _links_lock:
+        link = _links.get(serial_port)
+        if link is None:
+            link = _links[serial_port] = _Link()
+        return link
+
+
+def link_stats(serial_port) -> LinkStats:
+    return _link(serial_port).stats
+
+
+def set_retry_policy(serial_port, policy: RetryPolicy):
+    _link(serial_port).policy = policy
+
+
+def retry_policy(serial_port) -> RetryPolicy:
+    return _link(serial_port).policy
+
+
+def chunk_sizes(serial_port) -> ChunkSizes:
+    return _link(serial_port).chunks
+
+
+def pipeline_windows(serial_port) -> PipelineWindows:
+    return _link(serial_port).windows
+
+
+def set_tracer(serial_port, tracer: Optional[FrameTracer]):
+    _link(serial_port).tracer = tracer
+
+
+def encode_frame(serial_port, data: bytes) -> bytearray:
+    """编码一帧, 串口设置了 FrameTracer 时记录编码耗时"""
+    tracer = _link(serial_port).tracer
+    if tracer is None:
+        return frame_codec.encode_frame(data)
+    start = time.perf_counter()
+    frame = frame_codec.encode_frame(data)
+    tracer.encoded(time.perf_counter() - start)
+    return frame
+
+
+def open_serial_port(port: str, baudrate: int = 38400, timeout: float = 2):
+    # sim:// 开头的地址打开模拟电台, 用于无设备时测试和性能测试
+    if port.startswith(SIMULATOR_URL_PREFIX):
+        import radio_simulator
+        return radio_simulator.from_url(port, timeout)
+    # replay:// 开头的地址回放捕获的串口通信
+    if port.startswith(wire_capture.REPLAY_URL_PREFIX):
+        return wire_capture.from_url(port, timeout)
+    return serial.Serial(port, baudrate, timeout=timeout)
+
 
 def xor_arr(data: bytes):
-    tbl = [22, 108, 20, 230, 46, 145, 13, 64, 33, 53, 213, 64, 19, 3, 233, 128]
-    x = b""
-    r = 0
-    for byte in data:
-        x += bytes([byte ^ tbl[r]])
-        r = (r + 1) % len(tbl)
-    return x
+    return frame_codec.xor_obfuscate(data)
 
 
 def calculate_crc16_xmodem(data: bytes):
-    poly = 0x1021
-    crc = 0x0
-    for byte in data:
-        crc = crc ^ (byte << 8)
-        for i in range(8):
-            crc = crc << 1
-            if crc & 0x10000:
-                crc = (crc ^ poly) & 0xFFFF
-    return crc & 0xFFFF
+    return frame_codec.crc16_xmodem(data)
 
 
 def send_command(serial_port: serial.Serial, data: bytes):
-    crc = calculate_crc16_xmodem(data)
-    data2 = data + struct.pack("<H", crc)
+    return send_frame(serial_port, encode_frame(serial_port, data))
 
-    command = struct.pack(">HBB", 0xabcd, len(data), 0) + \
-              xor_arr(data2) + \
-              struct.pack(">H", 0xdcba)
+
+def send_frame(serial_port: serial.Serial, frame: frame_codec.Buffer):
+    """发送已经编码好的整帧"""
+    link = _link(serial_port)
+    start = time.perf_counter()
     try:
-        result = serial_port.write(command)
+        result = serial_port.write(frame)
     except Exception:
         raise Exception("串口写入数据失败！")
+    link.stats.frames_sent += 1
+    if link.tracer is not None:
+        end = time.perf_counter()
+        link.tracer.sent(frame, end - start, end)
     return result
 
 
-def receive_reply(serial_port: serial.Serial):
-    header = serial_port.read(4)
-    if len(header) != 4:
-        raise Exception("数据头长度不正确！")
-    if header[0] != 0xAB or header[1] != 0xCD or header[3] != 0x00:
-        raise Exception("数据头响应错误！")
-
-    cmd = serial_port.read(int(header[2]))
-    if len(cmd) != int(header[2]):
-        raise Exception("指令长度不正确！")
-
-    footer = serial_port.read(4)
-
-    if len(footer) != 4:
-        raise Exception("尾部数据长度不正确！")
-
-    if footer[2] != 0xDC or footer[3] != 0xBA:
-        raise Exception("尾部数据响应错误！")
-
-    cmd2 = xor_arr(cmd)
-    return cmd2
+def receive_reply(serial_port: serial.Serial, expected_length: int = 0, allow_resync: bool = True):
+    """接收一帧回复, 返回解码后的负载
+
+    从串口批量读取到缓冲区, 查找 0xABCD 帧头并校验帧尾, 丢弃帧之前和无效帧中的数据直到找到有效帧;
+    expected_length 为预计的整帧长度, 用于尽量一次读取完整帧, 多读到的数据留给下一次接收;
+    被丢弃的可能是本该收到的回复, allow_resync 为 False 时丢弃过数据就抛出异常, 不把下一帧当作本次的回复
+    """
+    link = _link(serial_port)
+    stats = link.stats
+    buf = link.rx_buffer
+    timed_out = False
+    discarded = 0
+    tracer = link.tracer
+    if tracer is not None:
+        # 单独读取第一个字节, 区分等待电台响应和接收回复的时间
+        wait_start = time.perf_counter()
+        if not buf:
+            data = serial_port.read(1)
+            buf += data
+            timed_out = not data
+        first_byte_at = time.perf_counter()
+    try:
+        while True:
+            start = buf.find(b'\xab\xcd')
+            # 找不到帧头时保留可能是帧头前半部分的最后一个字节
+            drop = max(len(buf) - 1, 0) if start < 0 else start
+            if drop:
+                del buf[:drop]
+                discarded += drop
+            if len(buf) >= 4:
+                frame_len = buf[2] + frame_codec.FRAME_OVERHEAD
+                if buf[3] != 0x00 or (len(buf) >= frame_len and
+                                      (buf[frame_len - 2] != 0xDC or buf[frame_len - 1] != 0xBA)):
+                    # 当前帧头是噪声或帧不完整, 从下一个字节继续查找
+                    del buf[:2]
+                    discarded += 2
+                    continue
+                if len(buf) >= frame_len:
+                    frame = bytes(buf[:frame_len])
+                    del buf[:frame_len]
+                    payload, received_crc, crc = frame_codec.decode_frame(frame)
+                    # 固件的回复不计算CRC而是填充 0xFFFF
+                    if received_crc != crc and received_crc != REPLY_CRC_PADDING:
+                        stats.crc_failures += 1
+                        raise Exception("回复CRC校验失败！")
+                    stats.frames_received += 1
+                    if discarded and not allow_resync:
+                        raise Exception(f"接收回复前丢弃了{discarded}字节, 回复可能已丢失！")
+                    if tracer is not None:
+                        end = time.perf_counter()
+                        tracer.received(first_byte_at - wait_start, end - first_byte_at, end)
+                    return payload
+                needed = frame_len - len(buf)
+            else:
+                needed = max(expected_length, 4) - len(buf)
+
+            if timed_out:
+                stats.timeouts += 1
+                if len(buf) < 4:
+                    raise Exception("数据头长度不正确！")
+                raise Exception("指令长度不正确！")
+            data = serial_port.read(max(needed, serial_port.in_waiting))
+            buf += data
+            # 串口超时前没有收到足够的数据, 解析已收到的数据后不再等待
+            timed_out = len(data) < needed
+    finally:
+        if discarded:
+            stats.resyncs += 1
+            stats.bytes_discarded += discarded
 
 
 def get_string(data: bytes, begin: int, max_len: int):
@@ -93,69 +302,272 @@ def sayhello(serial_port: serial.Serial):
     return firmware
 
 
+def transact(serial_port: serial.Serial, packet: bytes, check: Callable[[bytes], bool], name: str,
+             expected_length: int = 0) -> bytes:
+    """发送指令并接收回复, 回复错误或不符合 check 时清空输入缓冲区并以相同的内容重发
+
+    重发次数和等待时间由串口的 RetryPolicy 决定, 超过次数后抛出最后一次的错误
+    """
+    return transact_frame(serial_port, encode_frame(serial_port, packet), check, name, expected_length)
+
+
+def transact_frame(serial_port: serial.Serial, frame: frame_codec.Buffer, check: Callable[[bytes], bool], name: str,
+                   expected_length: int = 0) -> bytes:
+    """与 transact 相同, 但发送已经编码好的整帧"""
+    link = _link(serial_port)
+    attempt = 0
+    while True:
+        try:
+            send_frame(serial_port, frame)
+            reply = receive_reply(serial_port, expected_length)
+            if check(reply):
+                return reply
+            error = Exception(f'{name}响应错误！')
+        except Exception as e:
+            error = e
+        if attempt >= link.policy.max_retries:
+            raise error
+        link.stats.retries += 1
+        log(f'{name}失败, 第{attempt + 1}次重试 <-{error}')
+        # 等待期间到达的残留回复会一并丢弃
+        flush_input(serial_port, link.policy.delay(attempt))
+        attempt += 1
+
+
 def read_eeprom(serial_port: serial.Serial, offset: int, length: int):
-    read_mem = b"\x1b\x05\x08\x00" + \
-        struct.pack("<HBB", offset, length, 0) + \
-        b"\x6a\x39\x57\x64"
-    send_command(serial_port, read_mem)
-    o = receive_reply(serial_port)
+    o = transact(serial_port, _read_packet(offset, length, False),
+                 lambda reply: _read_reply_valid(reply, length), '读取EEPROM', _read_reply_size(length))
     return o[8:]
 
 
 def read_extra_eeprom(serial_port: serial.Serial, addr: int, length: int):
-    offset = addr >> 16
-    extra = addr & 0xFFFF
-    extra_bytes = struct.pack("<H", extra)
-    read_mem = b"\x2b\x05\x08\x00" + \
-               struct.pack("<HBB", offset, length, 0) + \
-               b"\x6a\x39\x57\x64" + \
-               extra_bytes
-    send_command(serial_port, read_mem)
-    o = receive_reply(serial_port)
+    o = transact(serial_port, _read_packet(addr, length, True),
+                 lambda reply: _read_reply_valid(reply, length), '读取扩容部分 EEPROM', _read_reply_size(length))
     return o[8:]
 
 
-def write_eeprom(serial_port: serial.Serial, offset: int, data: bytes):
-    dlen = len(data)
-    write_mem = b"\x1d\x05" + \
-                struct.pack("<BBHBB", dlen + 8, 0, offset, dlen, 1) + \
-                b"\x6a\x39\x57\x64" + data
+def _read_packet(addr: int, length: int, extended: bool):
+    if not extended:
+        return b"\x1b\x05\x08\x00" + \
+            struct.pack("<HBB", addr, length, 0) + \
+            b"\x6a\x39\x57\x64"
+    return b"\x2b\x05\x08\x00" + \
+        struct.pack("<HBB", addr >> 16, length, 0) + \
+        b"\x6a\x39\x57\x64" + \
+        struct.pack("<H", addr & 0xFFFF)
+
+
+def _read_reply_size(length: int):
+    # 读取回复的整帧长度: 8字节回复头 + 数据 + 帧开销
+    return 8 + length + frame_codec.FRAME_OVERHEAD
+
+
+def _read_reply_valid(reply: bytes, length: int):
+    return len(reply) == 8 + length and reply[0] == 0x1c
 
-    send_command(serial_port, write_mem)
-    o = receive_reply(serial_port)
 
-    if (o[0] == 0x1e
+def _read_reply_matches(reply: bytes, addr: int, length: int, extended: bool):
+    # 回复中回显了偏移(扩容读取为高16位)和长度
+    offset = addr >> 16 if extended else addr & 0xFFFF
+    return (len(reply) == 8 + length
             and
-            o[4] == (offset & 0xff)
+            reply[4] == (offset & 0xff)
             and
-            o[5] == (offset >> 8) & 0xff):
-        return True
-    else:
-        raise Exception("写入前8KiB EEPROM响应错误！")
+            reply[5] == (offset >> 8) & 0xff
+            and
+            reply[6] == length)
 
 
-def write_extra_eeprom(serial_port: serial.Serial, addr: int, data: bytes):
+def flush_input(serial_port: serial.Serial, quiet_time: float = 0.1):
+    # 等待串口静默后清空输入缓冲区, 丢弃仍在途中的回复
+    while True:
+        time.sleep(quiet_time)
+        if not serial_port.in_waiting:
+            break
+        serial_port.reset_input_buffer()
+    serial_port.reset_input_buffer()
+    link = _link(serial_port)
+    link.rx_buffer.clear()
+    if link.tracer is not None:
+        link.tracer.flushed()
+
+
+def read_eeprom_pipelined(serial_port: serial.Serial, start_addr: int, end_addr: int, length: int = 128,
+                          extended: bool = False, max_in_flight: Optional[int] = None):
+    """保持 max_in_flight 个读取请求在途, 按地址顺序逐页返回 (addr, data); max_in_flight 为空时使用串口的读取窗口
+
+    回复的回显与请求不符、接收时丢弃过数据或读取失败时, 清空输入缓冲区并回退为逐包读取;
+    扩容读取的回复只回显地址高16位, 在途请求使用互不相同的长度, 收到的数据再按 length 分页返回
+    """
+    replies = _read_pipelined(serial_port, start_addr, end_addr, length, extended,
+                              max_in_flight or _link(serial_port).windows.read)
+    if not extended:
+        yield from replies
+        return
+    page_addr = start_addr
+    buffer = bytearray()
+    for _, data in replies:
+        buffer += data
+        while len(buffer) >= length or (buffer and page_addr + len(buffer) == end_addr):
+            page = bytes(buffer[:length])
+            del buffer[:length]
+            yield page_addr, page
+            page_addr += len(page)
+
+
+def _read_pipelined(serial_port: serial.Serial, start_addr: int, end_addr: int, length: int, extended: bool,
+                    max_in_flight: int):
+    """按到达顺序返回每个回复的 (addr, data); 扩容读取时数据长度随请求变化"""
+    if extended:
+        # 长度不能减到 0
+        max_in_flight = max(1, min(max_in_flight, (length - 1) // EXTENDED_READ_LENGTH_STEP + 1))
+    pending = deque()
+    next_addr = start_addr
+    sent = 0
+    while pending or next_addr < end_addr:
+        if max_in_flight == 1:
+            # 逐包读取, 出错的帧按 RetryPolicy 重发
+            read_len = min(length, end_addr - next_addr)
+            reply = transact(serial_port, _read_packet(next_addr, read_len, extended),
+                             lambda r: _read_reply_valid(r, read_len), '读取EEPROM', _read_reply_size(read_len))
+            yield next_addr, reply[8:]
+            next_addr += read_len
+            continue
+
+        while next_addr < end_addr and len(pending) < max_in_flight:
+            read_len = length
+            if extended:
+                read_len -= sent % max_in_flight * EXTENDED_READ_LENGTH_STEP
+            read_len = min(read_len, end_addr - next_addr)
+            if extended and any(read_len == pending_len for _, pending_len in pending):
+                # 最后一个请求的长度与在途请求相同时, 等前面的回复收完再发送
+                break
+            send_command(serial_port, _read_packet(next_addr, read_len, extended))
+            pending.append((next_addr, read_len))
+            next_addr += read_len
+            sent += 1
+
+        addr, read_len = pending[0]
+        try:
+            reply = receive_reply(serial_port, _read_reply_size(read_len), allow_resync=False)
+            matched = _read_reply_matches(reply, addr, read_len, extended)
+        except Exception as e:
+            log(f'读取EEPROM响应错误 addr={hex(addr)} <-{e}')
+            matched = False
+        if not matched:
+            log('流水线读取回复不匹配, 回退为逐包读取')
+            _link(serial_port).stats.retries += 1
+            flush_input(serial_port)
+            max_in_flight = 1
+            pending.clear()
+            next_addr = addr
+            continue
+        pending.popleft()
+        yield addr, reply[8:]
+
+
+def _write_reply_matches(reply: bytes, offset: int):
+    return (len(reply) >= 6
+            and
+            reply[0] == 0x1e
+            and
+            reply[4] == (offset & 0xff)
+            and
+            reply[5] == (offset >> 8) & 0xff)
+
+
+def write_packet(addr: int, data: bytes, extended: bool) -> bytes:
+    """写入指令的负载; 不含随时间变化的内容, 相同地址和数据的写入帧总是相同的"""
+    if not extended:
+        dlen = len(data)
+        return b"\x1d\x05" + \
+            struct.pack("<BBHBB", dlen + 8, 0, addr, dlen, 1) + \
+            b"\x6a\x39\x57\x64" + data
     offset = addr >> 16
     extra = addr & 0xFFFF
     extra = struct.pack("<H", extra)
     length = len(data) + len(extra)
 
-    write_mem = b"\x38\x05\x1c\x00" + \
-                struct.pack("<HBB", offset, length, 0) + \
-                b"\x6a\x39\x57\x64" + \
-                extra + data
+    return b"\x38\x05\x1c\x00" + \
+        struct.pack("<HBB", offset, length, 0) + \
+        b"\x6a\x39\x57\x64" + \
+        extra + data
+
+
+def write_frame(serial_port: serial.Serial, addr: int, frame: frame_codec.Buffer, extended: bool):
+    """发送 write_packet 编码成的整帧并检查写入确认"""
+    # 确认中回显偏移, 扩容写入为地址高16位
+    offset = addr >> 16 if extended else addr
+    name = '写入扩容部分 EEPROM' if extended else '写入前8KiB EEPROM'
+    # 重发相同偏移的写入是幂等的, 丢失的确认可以直接重发
+    transact_frame(serial_port, frame, lambda o: _write_reply_matches(o, offset), name, WRITE_REPLY_SIZE)
+    return True
+
+
+def write_eeprom_pipelined(serial_port: serial.Serial, frames: Iterable[Tuple[int, frame_codec.Buffer]],
+                           extended: bool = False, max_in_flight: Optional[int] = None) -> Iterator[int]:
+    """每次连续发送 max_in_flight 个 (地址, 写入帧) 后再接收确认, 按发送顺序返回被确认的地址;
+    max_in_flight 为空时使用串口的写入窗口
+
+    确认中回显的偏移与在途的帧对应, 只重发确认缺失或不符的帧; 有确认缺失或超时时
+    (固件可能不能连续接收), 之后回退为逐包写入, 不再让每一批都等待超时
+    """
+    frames = iter(frames)
+    max_in_flight = max_in_flight or _link(serial_port).windows.write
+    while True:
+        if max_in_flight == 1:
+            # 逐包写入, 出错的帧按 RetryPolicy 重发
+            for addr, frame in frames:
+                write_frame(serial_port, addr, frame, extended)
+                yield addr
+            return
+
+        burst = list(itertools.islice(frames, max_in_flight))
+        if not burst:
+            return
+        for _, frame in burst:
+            send_frame(serial_port, frame)
+        missing = _unacknowledged_writes(serial_port, burst, extended)
+        if missing:
+            log(f'流水线写入有{len(missing)}帧确认缺失, 重发这些帧')
+            _link(serial_port).stats.retries += len(missing)
+            flush_input(serial_port)
+            for addr, frame in missing:
+                write_frame(serial_port, addr, frame, extended)
+            log('流水线写入确认缺失, 回退为逐包写入')
+            max_in_flight = 1
+        for addr, _ in burst:
+            yield addr
+
+
+def _unacknowledged_writes(serial_port: serial.Serial, burst: List[Tuple[int, frame_codec.Buffer]],
+                           extended: bool) -> List[Tuple[int, frame_codec.Buffer]]:
+    """接收一批写入帧的确认, 返回没有收到对应确认的 (地址, 写入帧)"""
+    unacknowledged = list(burst)
+    for _ in burst:
+        try:
+            reply = receive_reply(serial_port, WRITE_REPLY_SIZE, allow_resync=False)
+        except Exception as e:
+            # 超时后剩下的确认也不会再到达, 不再逐个等待
+            log(f'写入确认接收错误 <-{e}')
+            break
+        for i, (addr, _) in enumerate(unacknowledged):
+            if _write_reply_matches(reply, addr >> 16 if extended else addr):
+                del unacknowledged[i]
+                break
+    if extended and unacknowledged:
+        # 扩容写入的确认只回显地址高16位, 同一段内缺少确认时无法确定是哪一帧, 整段重发
+        segments = {addr >> 16 for addr, _ in unacknowledged}
+        unacknowledged = [item for item in burst if item[0] >> 16 in segments]
+    return unacknowledged
 
-    send_command(serial_port, write_mem)
-    o = receive_reply(serial_port)
 
-    if (o[0] == 0x1e
-            and
-            o[4] == (offset & 0xff)
-            and
-            o[5] == (offset >> 8) & 0xff):
-        return True
-    else:
-        raise Exception("写入扩容部分 EEPROM响应错误！")
+def write_eeprom(serial_port: serial.Serial, offset: int, data: bytes):
+    return write_frame(serial_port, offset, encode_frame(serial_port, write_packet(offset, data, False)), False)
+
+
+def write_extra_eeprom(serial_port: serial.Serial, addr: int, data: bytes):
+    return write_frame(serial_port, addr, encode_frame(serial_port, write_packet(addr, data, True)), True)
 
 
 def reset_radio(serial_port: serial.Serial):
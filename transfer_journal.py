@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import re
+from typing import Optional
+
+from const_vars import CONFIG_DIR
+from frame_codec import Buffer
+from logger import log
+
+JOURNAL_DIR = os.path.join(CONFIG_DIR, 'journal')
+
+# 每确认这么多页保存一次日志
+DEFAULT_CHECKPOINT_PAGES = 32
+
+
+class TransferJournal:
+    """记录一次写入中最后被电台确认的页, 断线重连后可以从中断处继续写入
+
+    每个串口、每个起始地址对应一个日志文件, 内容包含数据长度和SHA-256,
+    只有要写入的数据完全相同时才会从日志继续; resume 为 False 时总是从头写入
+    """
+
+    def __init__(self, port: str, resume: bool = True, journal_dir: Optional[str] = None,
+                 checkpoint_pages: int = DEFAULT_CHECKPOINT_PAGES):
+        self.port = port
+        self.resume = resume
+        self.journal_dir = journal_dir or JOURNAL_DIR
+        self.checkpoint_pages = checkpoint_pages
+        self._record: Optional[dict] = None
+        self._path = ''
+        self._unsaved = 0
+
+    def path_for(self, start_addr: int) -> str:
+        port = re.sub(r'[^\w.-]', '_', self.port)
+        return os.path.join(self.journal_dir, f'{port}_{start_addr:05x}.json')
+
+    def pending(self, start_addr: int, data: Buffer) -> int:
+        """返回日志中下一个需要写入的偏移, 没有可继续的写入时返回 0"""
+        try:
+            with open(self.path_for(start_addr), 'r') as fp:
+                record = json.load(fp)
+        except (OSError, ValueError):
+            return 0
+        if record.get('key') != _transfer_key(start_addr, data):
+            return 0
+        return min(int(record.get('next_offset', 0)), len(data))
+
+    def begin(self, start_addr: int, data: Buffer) -> int:
+        """开始一次写入, 返回开始写入的偏移"""
+        self._path = self.path_for(start_addr)
+        resume_offset = self.pending(start_addr, data) if self.resume else 0
+        self._record = {'key': _transfer_key(start_addr, data), 'next_offset': resume_offset}
+        self._unsaved = 0
+        return resume_offset
+
+    def record(self, offset: int, length: int):
+        """offset 处的页已被电台确认"""
+        self._record['next_offset'] = offset + length
+        self._unsaved += 1
+        if self._unsaved >= self.checkpoint_pages:
+            self.save()
+
+    def save(self):
+        if self._record is None:
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self._record, fp)
+        os.replace(tmp_path, self._path)
+        self._unsaved = 0
+
+    def interrupted(self):
+        self.save()
+        if self._record is not None:
+            log(f'写入中断, 已确认写入到偏移 {hex(self._record["next_offset"])}, 重新连接后可以继续写入')
+
+    def finish(self):
+        self._record = None
+        _remove(self._path)
+
+    def discard(self, start_addr: int):
+        _remove(self.path_for(start_addr))
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _transfer_key(start_addr: int, data: Buffer) -> str:
+    return f'{start_addr:x}:{len(data)}:{hashlib.sha256(data).hexdigest()}'
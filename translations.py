@@ -27,6 +27,9 @@ translations = {
         'backup_eeprom_button_text': '备份EEPROM',
         'restore_eeprom_button_text': '恢复EEPROM',
         'todo_button_text': '敬请期待',
+        'cancel_button_text': '取消操作',
+        'skip_unchanged_check_text': '跳过相同页',
+        'verify_check_text': '写入后校验',
 
         # Tooltip
         'eeprom_size_combo_tooltip_text': 'EEPROM芯片容量，若自动检测正确则无需修改',
@@ -48,7 +51,10 @@ translations = {
         'backup_eeprom_button_tooltip_text': '备份EEPROM中的数据，使用EEPROM下拉框可以选择所要备份的大小',
         'restore_eeprom_button_tooltip_text': '恢复EEPROM中的数据，使用EEPROM下拉框可以选择所要恢复的大小',
         'todo_button_tooltip_text': '敬请期待',
-        'language_combo_tooltip_text': '更改语言，重启程序生效'
+        'cancel_button_tooltip_text': '取消正在进行的读写操作，已写入的数据不会恢复',
+        'language_combo_tooltip_text': '更改语言，重启程序生效',
+        'skip_unchanged_check_tooltip_text': '写入字库、拼音表或恢复EEPROM前先读取目标区域，只写入内容不同的页',
+        'verify_check_tooltip_text': '写入完成后读回并校验写入的数据，自动重新写入不一致的页'
     },
     LanguageType.ENGLISH: {
         'tool_name': 'K5/K6 Tools',
@@ -74,6 +80,9 @@ translations = {
         'backup_eeprom_button_text': 'Backup EEPROM',
         'restore_eeprom_button_text': 'Restore EEPROM',
         'todo_button_text': 'Coming soon',
+        'cancel_button_text': 'Cancel',
+        'skip_unchanged_check_text': 'Skip unchanged',
+        'verify_check_text': 'Verify',
 
         'eeprom_size_combo_tooltip_text': 'EEPROM chip capacity, no need to modify if automatically detected correctly',
         'firmware_combo_tooltip_text': 'Firmware version, no need to modify if automatically detected correctly',
@@ -94,6 +103,9 @@ translations = {
         'backup_eeprom_button_tooltip_text': 'Backup data in EEPROM. Use the EEPROM dropdown to select the size to be backed up.',
         'restore_eeprom_button_tooltip_text': 'Restore data in EEPROM. Use the EEPROM dropdown to select the size to be restored.',
         'todo_button_tooltip_text': 'Coming soon',
-        'language_combo_tooltip_text': 'Change language, take effect after restart.'
+        'cancel_button_tooltip_text': 'Cancel the running read/write operation. Data already written is not rolled back.',
+        'language_combo_tooltip_text': 'Change language, take effect after restart.',
+        'skip_unchanged_check_tooltip_text': 'Read the target region before writing fonts, pinyin index or restoring EEPROM, and only write pages that differ.',
+        'verify_check_tooltip_text': 'Read back and verify written data after writing, rewriting any pages that differ.'
     }
 }
@@ -0,0 +1,260 @@
+import argparse
+import json
+import struct
+import time
+from collections import deque
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import frame_codec
+from logger import log
+
+REPLAY_URL_PREFIX = 'replay://'
+
+MAGIC = b'K5WC\x01'
+# 记录头: 类型, 相对开始捕获的时间 (秒), 数据长度
+RECORD_HEADER = struct.Struct('<BdI')
+# 串口原始数据 / 从中解析出的完整帧的负载 (已去除异或混淆)
+TX_RAW = 0
+RX_RAW = 1
+TX_FRAME = 2
+RX_FRAME = 3
+# 握手后的会话参数 (JSON): EEPROM大小、块大小等, 回放时代替检测、探测和缓存
+SESSION = 4
+KIND_NAMES = {TX_RAW: 'tx', RX_RAW: 'rx', TX_FRAME: 'tx-frame', RX_FRAME: 'rx-frame', SESSION: 'session'}
+
+Record = Tuple[int, float, bytes]
+
+
+def read_records(fp: BinaryIO) -> Iterator[Record]:
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise Exception('不是有效的串口捕获文件！')
+    while True:
+        header = fp.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        kind, timestamp, length = RECORD_HEADER.unpack(header)
+        data = fp.read(length)
+        if len(data) < length:
+            # 捕获时被中断, 最后一条记录不完整
+            return
+        yield kind, timestamp, data
+
+
+def load_records(path: str) -> List[Record]:
+    with open(path, 'rb') as fp:
+        return list(read_records(fp))
+
+
+def _split_frames(buf: bytearray) -> Iterator[bytes]:
+    """从缓冲区中取出所有完整的帧的负载, 不完整的部分留在缓冲区"""
+    while True:
+        start = buf.find(b'\xab\xcd')
+        if start < 0:
+            del buf[:max(len(buf) - 1, 0)]
+            return
+        del buf[:start]
+        if len(buf) < 4:
+            return
+        frame_len = buf[2] + frame_codec.FRAME_OVERHEAD
+        if len(buf) < frame_len:
+            return
+        try:
+            payload = frame_codec.decode_frame(buf[:frame_len])[0]
+        except Exception:
+            del buf[:2]
+            continue
+        del buf[:frame_len]
+        yield payload
+
+
+class CapturingPort:
+    """包装串口, 把每次读写的原始数据和解析出的帧负载连同时间戳记录到二进制文件"""
+
+    def __init__(self, port, path: str):
+        self._port = port
+        self.path = path
+        self._fp = open(path, 'wb')
+        self._fp.write(MAGIC)
+        self._start = time.perf_counter()
+        self._tx = bytearray()
+        self._rx = bytearray()
+
+    def _record(self, kind: int, data: bytes, timestamp: float):
+        self._fp.write(RECORD_HEADER.pack(kind, timestamp, len(data)))
+        self._fp.write(data)
+
+    def _capture(self, kind: int, frame_kind: int, buf: bytearray, data: bytes):
+        timestamp = time.perf_counter() - self._start
+        self._record(kind, data, timestamp)
+        buf += data
+        for payload in _split_frames(buf):
+            self._record(frame_kind, payload, timestamp)
+
+    def record_session(self, info: dict):
+        self._record(SESSION, json.dumps(info).encode(), time.perf_counter() - self._start)
+
+    def write(self, data) -> int:
+        result = self._port.write(data)
+        self._capture(TX_RAW, TX_FRAME, self._tx, bytes(data))
+        return result
+
+    def read(self, size: int = 1) -> bytes:
+        data = self._port.read(size)
+        if data:
+            self._capture(RX_RAW, RX_FRAME, self._rx, data)
+        return data
+
+    @property
+    def timeout(self):
+        return self._port.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._port.timeout = value
+
+    def close(self):
+        if not self._fp.closed:
+            self._fp.close()
+            log(f'串口通信已捕获到 {self.path}')
+        self._port.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._port, name)
+
+
+class ReplayPort:
+    """把捕获文件作为串口回放: 第 i 次写入后, 按记录的间隔放出捕获时第 i 次写入之后收到的数据
+
+    写入的内容与捕获时不同时只记录一次警告并继续回放; realtime 为 False 时不等待记录的间隔;
+    session 为捕获时在握手后记录的会话参数, 没有时为 None, 用 skip_to_session 跳过之前的检测和探测
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = 2, realtime: bool = True):
+        self.path = path
+        self.timeout = timeout
+        self.realtime = realtime
+        self.is_open = True
+        self.mismatches = 0
+        self.session: Optional[dict] = None
+        # 会话参数之后的写入次数
+        self._after_session = 0
+        # 每次写入对应的 (写入内容, [(相对写入的延迟, 收到的数据)])
+        self._exchanges = deque()
+        # 第一次写入之前收到的数据
+        leading = []
+        last_tx = None
+        for kind, timestamp, data in load_records(path):
+            if kind == TX_RAW:
+                last_tx = timestamp
+                self._exchanges.append((data, []))
+            elif kind == RX_RAW:
+                target = self._exchanges[-1][1] if self._exchanges else leading
+                target.append((timestamp - (last_tx or 0.0), data))
+            elif kind == SESSION and self.session is None:
+                self.session = json.loads(data)
+                session_index = len(self._exchanges)
+        if self.session is not None:
+            self._after_session = len(self._exchanges) - session_index
+        # (可读取时间, 数据)
+        self._pending = deque((time.perf_counter() + delay, data) for delay, data in leading)
+        self._rx_buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data) -> int:
+        now = time.perf_counter()
+        if not self._exchanges:
+            self._mismatch('捕获中没有更多的写入')
+            return len(data)
+        expected, replies = self._exchanges.popleft()
+        if bytes(data) != expected:
+            self._mismatch(f'第{self.mismatches + 1}次写入与捕获的内容不同')
+        for delay, reply in replies:
+            self._pending.append((now + delay if self.realtime else now, reply))
+        return len(data)
+
+    def skip_to_session(self):
+        """跳过握手之后、会话参数之前的记录, 丢弃还没有读取的数据"""
+        while len(self._exchanges) > self._after_session:
+            self._exchanges.popleft()
+        self._pending.clear()
+        self._rx_buffer.clear()
+
+    def _mismatch(self, message: str):
+        if not self.mismatches:
+            log(f'回放偏离捕获: {message}, 继续按顺序回放')
+        self.mismatches += 1
+
+    def flush(self):
+        pass
+
+    def _collect_ready(self, now: float):
+        while self._pending and self._pending[0][0] <= now:
+            self._rx_buffer += self._pending.popleft()[1]
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while True:
+            now = time.perf_counter()
+            self._collect_ready(now)
+            if len(self._rx_buffer) >= size:
+                break
+            next_ready = self._pending[0][0] if self._pending else None
+            if next_ready is None or (deadline is not None and next_ready > deadline):
+                # 捕获中没有更多数据, 与真实串口一样等到超时
+                if deadline is not None and self.realtime:
+                    time.sleep(max(deadline - now, 0))
+                break
+            time.sleep(max(next_ready - now, 0))
+        data = bytes(self._rx_buffer[:size])
+        del self._rx_buffer[:size]
+        return data
+
+    @property
+    def in_waiting(self) -> int:
+        self._collect_ready(time.perf_counter())
+        return len(self._rx_buffer)
+
+    def reset_input_buffer(self):
+        self._collect_ready(time.perf_counter())
+        self._rx_buffer.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+
+def from_url(url: str, timeout: Optional[float] = 2) -> ReplayPort:
+    """replay://<捕获文件>[?fast] 返回回放串口, fast 表示不等待记录的间隔"""
+    path, _, query = url[len(REPLAY_URL_PREFIX):].partition('?')
+    return ReplayPort(path, timeout, realtime=query != 'fast')
+
+
+def dump(path: str):
+    for kind, timestamp, data in load_records(path):
+        print(f'{timestamp:12.6f} {KIND_NAMES.get(kind, kind):>8} {len(data):4} {data.hex(" ")}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='查看串口捕获文件')
+    parser.add_argument('path')
+    dump(parser.parse_args(argv).path)
+
+
+if __name__ == '__main__':
+    main()